@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import pygame
+import settings
+from os import path
+
+class Spritesheet:
+    def __init__(self, filename):
+        self.spritesheet = pygame.image.load(filename).convert_alpha()
+
+    def get_image(self, x, y, width, height, scale=4):
+        image = pygame.Surface((width, height))
+        image.blit(self.spritesheet, (0, 0), (x, y, width, height))
+        image = pygame.transform.scale(image, (width // scale, height // scale))
+        return image
+
+
+# Offline baking of all the player animations into one packed image plus a json manifest of frame rects.
+# Run "python atlas.py" to bake it ahead of time. The game bakes the atlas by itself when it starts if it
+# can't find one, or if the spritesheets below or this table have changed since it was baked.
+ATLAS_IMAGE = 'player_atlas.png'
+ATLAS_MANIFEST = 'player_atlas.json'
+ATLAS_VERSION = 1
+ATLAS_WIDTH = 1024
+
+SCALE = 4
+
+# name: spritesheet, frame width, frame height, number of frames, black is transparent, needs a left copy
+ANIMATIONS = {
+    'standing':       ('player_idle.png',             197, 257, 8, True,  True),
+    'walking':        ('player_walking.png',          240, 258, 8, True,  True),
+    'running':        ('player_running.png',          313, 260, 8, True,  True),
+    'jumping':        ('player_jumping.png',          223, 342, 8, True,  True),
+    'double_jumping': ('player_double_jumping.png',   286, 287, 8, True,  True),
+    'wall_slide':     ('player_wall_slide.png',       206, 300, 4, True,  True),
+    'sword_attack':   ('player_attack.png',           512, 405, 8, True,  True),
+    'thrust_attack':  ('player_thrust.png',           358, 265, 8, True,  True),
+    'ranged_attack':  ('player_ranged_attack.png',    279, 276, 8, True,  True),
+    'bullet':         ('red_ball_bullet.png',          60,  61, 8, False, False),
+    'teleporting':    ('player_teleport.png',         185, 198, 8, True,  False),
+}
+
+
+def cut_frames(img_folder):
+    # Cut out, scale down and flip every frame, returns {strip name: [frames]}
+    strips = {}
+    for name, (sheet, width, height, count, colorkey, flipped) in ANIMATIONS.items():
+        spritesheet = Spritesheet(path.join(img_folder, sheet))
+        frames = [spritesheet.get_image(width * i, 0, width, height, SCALE) for i in range(count)]
+        if flipped:
+            strips[name + '_right'] = frames
+            strips[name + '_left'] = [pygame.transform.flip(frame, True, False) for frame in frames]
+        else:
+            strips[name] = frames
+    return strips
+
+
+def strip_colorkeys():
+    # {strip name: whether black is transparent} for every strip the atlas should contain
+    colorkeys = {}
+    for name, (sheet, width, height, count, colorkey, flipped) in ANIMATIONS.items():
+        for strip in ([name + '_right', name + '_left'] if flipped else [name]):
+            colorkeys[strip] = colorkey
+    return colorkeys
+
+
+def animation_specs():
+    # ANIMATIONS the way it comes back out of the manifest, to spot an atlas baked from an older table
+    return {name: list(spec) for name, spec in ANIMATIONS.items()}
+
+
+def sheet_names():
+    return sorted(set(spec[0] for spec in ANIMATIONS.values()))
+
+
+def sheet_hash(img_folder, sheet):
+    digest = hashlib.sha1()
+    with open(path.join(img_folder, sheet), 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def sheet_sources(img_folder):
+    # {sheet: size, modification time and content hash} of every spritesheet in ANIMATIONS, for the manifest
+    sources = {}
+    for sheet in sheet_names():
+        stat = os.stat(path.join(img_folder, sheet))
+        sources[sheet] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha1': sheet_hash(img_folder, sheet)}
+    return sources
+
+
+def sheets_changed(manifest, manifest_file, img_folder):
+    # Whether any spritesheet differs from the ones the atlas was baked from. Sheets whose size and modification
+    # time still match aren't read at all, the rest get hashed, and when they turn out the same after all their
+    # new times go into the manifest so they don't need hashing again next time.
+    sources = manifest.get('sheets')
+    if not isinstance(sources, dict) or sorted(sources) != sheet_names():
+        return True
+    touched = False
+    for sheet, source in sources.items():
+        stat = os.stat(path.join(img_folder, sheet))
+        if (stat.st_size, stat.st_mtime_ns) == (source['size'], source['mtime_ns']):
+            continue
+        if sheet_hash(img_folder, sheet) != source['sha1']:
+            return True
+        source['size'] = stat.st_size
+        source['mtime_ns'] = stat.st_mtime_ns
+        touched = True
+    if touched:
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=1)
+    return False
+
+
+def pack(strips):
+    # Simple shelf packing, tallest frames first. Returns the atlas height and {strip name: [[x, y, w, h]]}
+    frames = [(strip, i, frame.get_size()) for strip, strip_frames in strips.items()
+              for i, frame in enumerate(strip_frames)]
+    frames.sort(key=lambda frame: -frame[2][1])
+
+    rects = {strip: [None] * len(strip_frames) for strip, strip_frames in strips.items()}
+    x = y = shelf_height = 0
+    for strip, i, (width, height) in frames:
+        if x + width > ATLAS_WIDTH:
+            x = 0
+            y += shelf_height
+            shelf_height = 0
+        rects[strip][i] = [x, y, width, height]
+        x += width
+        shelf_height = max(shelf_height, height)
+    return y + shelf_height, rects
+
+
+def bake(img_folder):
+    strips = cut_frames(img_folder)
+    height, rects = pack(strips)
+
+    atlas = pygame.Surface((ATLAS_WIDTH, height))
+    for strip, strip_frames in strips.items():
+        for frame, rect in zip(strip_frames, rects[strip]):
+            atlas.blit(frame, rect[:2])
+
+    pygame.image.save(atlas, path.join(img_folder, ATLAS_IMAGE))
+    with open(path.join(img_folder, ATLAS_MANIFEST), 'w') as f:
+        json.dump({'version': ATLAS_VERSION, 'animations': animation_specs(), 'sheets': sheet_sources(img_folder),
+                   'frames': rects, 'colorkey': strip_colorkeys()}, f, indent=1)
+
+
+def load(img_folder):
+    # Returns {strip name: [frames]}, e.g. 'walking_left'. Frames are subsurfaces of the one atlas image.
+    manifest_file = path.join(img_folder, ATLAS_MANIFEST)
+    manifest = None
+    if path.isfile(manifest_file) and path.isfile(path.join(img_folder, ATLAS_IMAGE)):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    if manifest is None or manifest.get('version') != ATLAS_VERSION or \
+            manifest.get('animations') != animation_specs() or sheets_changed(manifest, manifest_file, img_folder):
+        bake(img_folder)
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+
+    atlas = pygame.image.load(path.join(img_folder, ATLAS_IMAGE)).convert()
+    strips = {}
+    for strip, rects in manifest['frames'].items():
+        frames = []
+        for rect in rects:
+            frame = atlas.subsurface(rect)
+            if manifest['colorkey'][strip]:
+                frame.set_colorkey(settings.BLACK)
+            frames.append(frame)
+        strips[strip] = frames
+    return strips
+
+
+def frame_key(name, i, flip):
+    sheet, width, height, count, colorkey, flipped = ANIMATIONS[name]
+    return sheet, (width * i, 0, width, height), SCALE, flip, colorkey
+
+
+class FrameRegistry:
+    # Process wide cache of animation frames keyed by (sheet, frame rect, scale, flip, colorkey).
+    # Nothing is loaded until a frame is first asked for, and every caller gets back the very same Surface
+    # objects, so any number of players, ghosts or effects share one copy of each frame. Frames that are in
+    # the baked atlas come out of it, anything else is cut straight from its spritesheet.
+    def __init__(self, img_folder):
+        self.img_folder = img_folder
+        self.frames = {}
+        self.animations = {}
+        self.sheets = {}
+        self.atlas_rects = None
+        self.atlas = None
+
+    def load_atlas(self):
+        strips = load(self.img_folder)
+        self.atlas_rects = {}
+        for name, (sheet, width, height, count, colorkey, flipped) in ANIMATIONS.items():
+            for flip in ([False, True] if flipped else [False]):
+                if flipped:
+                    strip = name + ('_left' if flip else '_right')
+                else:
+                    strip = name
+                for i in range(count):
+                    self.atlas_rects[frame_key(name, i, flip)] = strips[strip][i]
+
+    def get_frame(self, sheet, rect, scale=SCALE, flip=False, colorkey=True):
+        key = (sheet, tuple(rect), scale, flip, colorkey)
+        frame = self.frames.get(key)
+        if frame is not None:
+            return frame
+
+        if self.atlas_rects is None:
+            self.load_atlas()
+        frame = self.atlas_rects.get(key)
+        if frame is None:
+            if sheet not in self.sheets:
+                self.sheets[sheet] = Spritesheet(path.join(self.img_folder, sheet))
+            frame = self.sheets[sheet].get_image(*rect, scale=scale)
+            if flip:
+                frame = pygame.transform.flip(frame, True, False)
+            if colorkey:
+                frame.set_colorkey(settings.BLACK)
+
+        self.frames[key] = frame
+        return frame
+
+    def get_animation(self, name, facing=None):
+        # All frames of one of the ANIMATIONS, facing is 'right' or 'left' for the ones that have both
+        key = (name, facing)
+        frames = self.animations.get(key)
+        if frames is None:
+            sheet, width, height, count, colorkey, flipped = ANIMATIONS[name]
+            frames = [self.get_frame(*frame_key(name, i, facing == 'left')) for i in range(count)]
+            self.animations[key] = frames
+        return frames
+
+
+frames = FrameRegistry(path.join(path.dirname(path.abspath(__file__)), 'img'))
+
+
+if __name__ == '__main__':
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)
+    bake(path.join(path.dirname(path.abspath(__file__)), 'img'))
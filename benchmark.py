@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+from os import path
+
+try:
+    import resource
+except ImportError:
+    # not on windows, results just go without peak memory there
+    resource = None
+
+# Deterministic performance benchmark over the shipped maps plus bigger synthetic copies of them.
+#     python benchmark.py                          all maps, results in bench_results/<commit>.json
+#     python benchmark.py --frames 2000 --output before.json
+# Every map runs in its own process so peak memory is per map. Each one is loaded cold (no level cache),
+# loaded again warm, then played for the given number of frames in headless mode with the same scripted
+# input every time, drawing every frame.
+GAME_FOLDER = path.dirname(path.abspath(__file__))
+MAPS = ['Map1.tmx', 'Map2.tmx', 'testmap.tmx', '1920test.tmx']
+# synthetic maps: name, source map, copies across, copies down
+SYNTHETIC = [('Map1x10.tmx', 'Map1.tmx', 5, 2), ('Map1x100.tmx', 'Map1.tmx', 10, 10)]
+SEED = 1
+
+
+def input_script(frames, seed=SEED):
+    # Run right and left, jump, sprint and shoot in a fixed pseudo random pattern
+    rng = random.Random(seed)
+    script = {}
+    for frame in range(0, frames, 30):
+        script[frame] = {'axes': {'LeftHorizontal': rng.choice([-1.0, 0.0, 1.0]),
+                                  'Trigger': rng.choice([-1.0, 0.0, 0.9])}}
+    for frame in range(7, frames, 45):
+        script.setdefault(frame, {}).setdefault('press', []).append('A')
+        script.setdefault(frame + 6, {}).setdefault('release', []).append('A')
+    for frame in range(11, frames, 50):
+        script.setdefault(frame, {}).setdefault('press', []).append('B')
+        script.setdefault(frame + 2, {}).setdefault('release', []).append('B')
+    return script
+
+
+def make_synthetic(source, target, across, down):
+    # Tile a map across x down times, tile layers and objects both, keeping only the first player spawn
+    tree = ElementTree.parse(source)
+    root = tree.getroot()
+    folder = path.dirname(path.abspath(source))
+    width = int(root.get('width'))
+    height = int(root.get('height'))
+    pixel_width = width * int(root.get('tilewidth'))
+    pixel_height = height * int(root.get('tileheight'))
+
+    # the copy lives somewhere else, so point tilesets and images at absolute paths
+    for element in root.iter():
+        if element.get('source'):
+            element.set('source', path.join(folder, element.get('source')))
+
+    root.set('width', str(width * across))
+    root.set('height', str(height * down))
+    for layer in root.iter('layer'):
+        data = layer.find('data')
+        if data.get('encoding') != 'csv':
+            raise ValueError('only csv tile layers can be tiled: ' + source)
+        rows = [row.rstrip(',') for row in data.text.strip().split('\n')]
+        rows = [','.join([row] * across) for row in rows] * down
+        data.text = '\n' + ',\n'.join(rows) + '\n'
+        layer.set('width', str(width * across))
+        layer.set('height', str(height * down))
+
+    next_id = 1
+    for group in root.iter('objectgroup'):
+        originals = list(group.findall('object'))
+        for obj in originals:
+            group.remove(obj)
+        for j in range(down):
+            for i in range(across):
+                for obj in originals:
+                    if obj.get('type') == 'Player' and (i or j):
+                        continue
+                    copy = ElementTree.fromstring(ElementTree.tostring(obj))
+                    copy.set('id', str(next_id))
+                    copy.set('x', str(float(obj.get('x')) + i * pixel_width))
+                    copy.set('y', str(float(obj.get('y')) + j * pixel_height))
+                    group.append(copy)
+                    next_id += 1
+    root.set('nextobjectid', str(next_id))
+    tree.write(target, encoding='UTF-8', xml_declaration=True)
+
+
+def run_map(map_file, frames, cache_folder):
+    # Runs inside the worker process, returns the results for one map
+    os.environ['PLATFORMER_HEADLESS'] = '1'
+    sys.path.insert(0, GAME_FOLDER)
+    import game
+    import inputs
+
+    app = game.Game(joystick=inputs.ScriptedJoystick(input_script(frames)))
+    app.cache_folder = cache_folder
+    app.new()
+    # don't let the next level baking in the background get into the timings, or its bake into the cold load
+    app.loader.wait()
+    app.loader.clear()
+
+    for baked in os.listdir(cache_folder):
+        if baked.startswith(path.splitext(path.basename(map_file))[0] + '.'):
+            os.remove(path.join(cache_folder, baked))
+    app.clear_level()
+    start = time.perf_counter()
+    app.load_level(map_file)
+    load_cold = time.perf_counter() - start
+
+    app.clear_level()
+    start = time.perf_counter()
+    app.load_level(map_file)
+    load_warm = time.perf_counter() - start
+
+    app.playing = True
+    update_times = []
+    draw_times = []
+    checks = app.collision_index.checks
+    for frame in range(frames):
+        start = time.perf_counter()
+        app.step()
+        middle = time.perf_counter()
+        app.draw()
+        end = time.perf_counter()
+        app.profiler.end_frame()
+        update_times.append(middle - start)
+        draw_times.append(end - middle)
+        if not app.playing:
+            break
+    checks = app.collision_index.checks - checks
+
+    ran = len(update_times)
+    update_times.sort()
+    draw_times.sort()
+    return {
+        'map': path.basename(map_file),
+        'frames': ran,
+        # all of the level's blocks, not just the ones streamed in at the end
+        'blocks': sum(kind == 'block' for kind, spec in app.streamer.specs),
+        'load_cold_ms': load_cold * 1000,
+        'load_warm_ms': load_warm * 1000,
+        'update_ms': sum(update_times) / ran * 1000,
+        'update_p95_ms': update_times[int(ran * 0.95)] * 1000,
+        'draw_ms': sum(draw_times) / ran * 1000,
+        'draw_p95_ms': draw_times[int(ran * 0.95)] * 1000,
+        'collision_checks_per_frame': checks / ran,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def peak_rss_mb():
+    # Peak memory of this process so far, None where the resource module doesn't exist
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes everywhere else
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=GAME_FOLDER,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Time loading, updating and drawing every map.')
+    parser.add_argument('--frames', type=int, default=600, help='frames each map is played for')
+    parser.add_argument('--output', help='json file for the results, bench_results/<commit>.json by default')
+    # how main runs each map in its own process
+    parser.add_argument('--worker', nargs=2, metavar=('MAP', 'CACHE_FOLDER'), help=argparse.SUPPRESS)
+    options = parser.parse_args(args)
+    frames = options.frames
+
+    if options.worker:
+        map_file, cache_folder = options.worker
+        print(json.dumps(run_map(map_file, frames, cache_folder)))
+        return
+
+    bench_folder = path.join(GAME_FOLDER, 'bench_results')
+    cache_folder = path.join(bench_folder, 'cache')
+    if not path.isdir(cache_folder):
+        os.makedirs(cache_folder)
+
+    map_files = [path.join(GAME_FOLDER, 'maps', name) for name in MAPS]
+    for name, source, across, down in SYNTHETIC:
+        target = path.join(bench_folder, name)
+        make_synthetic(path.join(GAME_FOLDER, 'maps', source), target, across, down)
+        map_files.append(target)
+
+    commit = git_commit()
+    results = []
+    for map_file in map_files:
+        # pygame's import banner is the only other thing that would end up on the worker's stdout
+        worker = subprocess.run([sys.executable, path.abspath(__file__), '--worker', map_file, cache_folder,
+                                 '--frames', str(frames)], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT='1'))
+        if worker.returncode != 0:
+            sys.stderr.write(worker.stderr.decode())
+            raise SystemExit('benchmark failed on ' + map_file)
+        result = json.loads(worker.stdout.decode())
+        results.append(result)
+        line = '{map:<16}{blocks:>7} blocks  load {load_cold_ms:8.1f} / {load_warm_ms:6.1f} ms  ' \
+               'update {update_ms:7.3f} ms  draw {draw_ms:7.3f} ms  checks {collision_checks_per_frame:8.1f}'
+        if result['peak_rss_mb'] is not None:
+            line += '  rss {peak_rss_mb:7.1f} MB'
+        print(line.format(**result))
+
+    output = options.output or path.join(bench_folder, commit + '.json')
+    with open(output, 'w') as f:
+        json.dump({'commit': commit, 'frames': frames, 'seed': SEED, 'results': results}, f, indent=1)
+    print('results written to ' + output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
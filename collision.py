@@ -0,0 +1,402 @@
+import math
+import numpy
+import pygame
+import settings
+import sprites
+
+
+class SpatialHash:
+    # Uniform grid of buckets keyed by tile coordinates. Collision code asks it for the objects near a rect
+    # instead of looping over every block in the level, so cost depends on local density and not level size.
+    # Objects (blocks, interactables) are bucketed once when they get added and never move.
+    def __init__(self, cell_size=settings.TILESIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        # insertion order so query results come back in the same order the old group loops used
+        self.order = {}
+        self.counter = 0
+        # running totals for benchmarks: queries made and candidates handed back to be tested
+        self.queries = 0
+        self.checks = 0
+
+    def cell_keys(self, rect):
+        size = self.cell_size
+        left = rect.left // size
+        top = rect.top // size
+        right = max(rect.right - 1, rect.left) // size
+        bottom = max(rect.bottom - 1, rect.top) // size
+        return [(x, y) for x in range(left, right + 1) for y in range(top, bottom + 1)]
+
+    def add(self, obj, order=None):
+        # order puts obj at a fixed place in query results instead of after everything added before it
+        if obj not in self.order:
+            if order is None:
+                order = self.counter
+                self.counter += 1
+            self.order[obj] = order
+
+        for key in self.cell_keys(obj.rect):
+            self.cells.setdefault(key, []).append(obj)
+
+    def remove(self, obj):
+        if obj not in self.order:
+            return
+        del self.order[obj]
+
+        for key in self.cell_keys(obj.rect):
+            bucket = self.cells.get(key)
+            if bucket and obj in bucket:
+                bucket.remove(obj)
+                if not bucket:
+                    del self.cells[key]
+
+    def query(self, rect, group=None):
+        # Everything whose bucket overlaps rect, optionally limited to members of a sprite group.
+        # These are candidates only, callers still do their own colliderect tests.
+        found = set()
+        for key in self.cell_keys(rect):
+            bucket = self.cells.get(key)
+            if bucket:
+                found.update(bucket)
+
+        if group is not None:
+            found = [obj for obj in found if obj in group]
+        self.queries += 1
+        self.checks += len(found)
+        return sorted(found, key=self.order.__getitem__)
+
+
+class ContactSensor:
+    # Ground, wall and platform contact for one body plus the friction of the block under it.
+    # Everything is worked out with a single index query the first time it is asked for, then reused
+    # until the watched rect moves or a new level swaps the collision index out.
+    def __init__(self, game, rect):
+        self.game = game
+        self.rect = rect
+        self.key = None
+        self.index = None
+
+        self.ground = False
+        self.left_wall = False
+        self.right_wall = False
+        self.inside_wall = False
+        self.platform = False
+        self.friction = 0
+
+    def refresh(self):
+        rect = self.rect
+        key = (rect.x, rect.y, rect.width, rect.height)
+        index = self.game.collision_index
+        if key == self.key and index is self.index:
+            return
+        self.key = key
+        self.index = index
+
+        below = rect.move(0, 1)
+        left = rect.move(-1, 0)
+        right = rect.move(1, 0)
+
+        self.ground = False
+        self.left_wall = False
+        self.right_wall = False
+        self.inside_wall = False
+        self.platform = False
+        self.friction = 0
+
+        # blocks come back in level order, so the last block touched underneath decides friction like before
+        for block in blocks_near(self.game, rect.inflate(2, 2)):
+            if below.colliderect(block.rect):
+                self.ground = True
+                self.friction = block.friction
+                if block.block_type.platform and below.bottom >= block.rect.top and below.top < block.rect.top:
+                    self.platform = True
+            if block.block_type.wall:
+                if left.colliderect(block.rect):
+                    self.left_wall = True
+                if right.colliderect(block.rect):
+                    self.right_wall = True
+                if rect.colliderect(block.rect):
+                    self.inside_wall = True
+
+
+def time_of_impact(rect, dx, dy, other):
+    # Sweep rect by (dx, dy) against the still rect other. Returns (t, axis) for the moment along the move,
+    # 0 <= t < 1, where they start to overlap, axis being 0 if a left or right face got hit and 1 for top or
+    # bottom. None when they never overlap on the way, or already overlap at the start.
+    # Rects that only touch don't overlap, same as colliderect, so moving along a face is not a hit.
+    if dx > 0:
+        x_entry = (other.left - rect.right) / dx
+        x_exit = (other.right - rect.left) / dx
+    elif dx < 0:
+        x_entry = (other.right - rect.left) / dx
+        x_exit = (other.left - rect.right) / dx
+    elif rect.left < other.right and other.left < rect.right:
+        x_entry, x_exit = -math.inf, math.inf
+    else:
+        return None
+
+    if dy > 0:
+        y_entry = (other.top - rect.bottom) / dy
+        y_exit = (other.bottom - rect.top) / dy
+    elif dy < 0:
+        y_entry = (other.bottom - rect.top) / dy
+        y_exit = (other.top - rect.bottom) / dy
+    elif rect.top < other.bottom and other.top < rect.bottom:
+        y_entry, y_exit = -math.inf, math.inf
+    else:
+        return None
+
+    entry = max(x_entry, y_entry)
+    if entry < 0 or entry >= 1 or entry >= min(x_exit, y_exit):
+        return None
+    # hitting a corner exactly counts as landing on it, like moving x first and then y always did
+    return entry, 0 if x_entry > y_entry else 1
+
+
+def push_out(rect, other):
+    # Shortest (dx, dy) that moves rect out of other when they overlap. On a tie up wins, then down, left and
+    # right, so something sunk into the ground ends up standing on it.
+    up = rect.bottom - other.top
+    down = other.bottom - rect.top
+    left = rect.right - other.left
+    right = other.right - rect.left
+    shortest = min(up, down, left, right)
+    if shortest == up:
+        return 0, -up
+    if shortest == down:
+        return 0, down
+    if shortest == left:
+        return -left, 0
+    return right, 0
+
+
+def merge_runs(blocks, axis):
+    # Merge blocks that sit end to end along one axis and have the same extent across it
+    pos, size = axis, axis + 2
+    other_pos, other_size = 1 - axis, 3 - axis
+
+    rows = {}
+    for block in blocks:
+        rows.setdefault((block[4], block[other_pos], block[other_size]), []).append(block)
+
+    result = []
+    for row in rows.values():
+        row.sort(key=lambda block: block[pos])
+        current = row[0]
+        for block in row[1:]:
+            if block[pos] == current[pos] + current[size]:
+                current[size] += block[size]
+                current[5] = min(current[5], block[5])
+            else:
+                result.append(current)
+                current = block
+        result.append(current)
+    return result
+
+
+def merge_blocks(specs):
+    # Join touching blocks of the same kind into bigger rectangles so there is less to collide against.
+    # specs is a list of (x, y, w, h, key) in level order, key being whatever has to match for two blocks to
+    # merge. Two rects only merge when they share a whole edge, so the covered area stays exactly the same.
+    # Returns the merged (x, y, w, h, key) list, each merged block sitting where its first piece was.
+    blocks = [[x, y, w, h, key, order] for order, (x, y, w, h, key) in enumerate(specs)]
+
+    count = None
+    while count != len(blocks):
+        count = len(blocks)
+        blocks = merge_runs(blocks, 0)
+        blocks = merge_runs(blocks, 1)
+
+    blocks.sort(key=lambda block: block[5])
+    return [(x, y, w, h, key) for x, y, w, h, key, order in blocks]
+
+
+class BlockGrid:
+    # Tile sized grid saying how much of each cell is covered by blocks, for batch tests of many small rects
+    # at once: EMPTY cells touch no block, SOLID cells lie completely inside a single block, and PARTIAL
+    # cells have some block in them and need an exact test against the spatial hash.
+    EMPTY = 0
+    SOLID = 1
+    PARTIAL = 2
+
+    def __init__(self, width, height, rects, cell_size=settings.TILESIZE, tiles=None):
+        # tiles is the level's TileGrid if it has one, its tiles have to be cell_size
+        check_tile_size(tiles, cell_size)
+        self.cell_size = cell_size
+        self.columns = -(-width // cell_size)
+        self.rows = -(-height // cell_size)
+        self.cells = numpy.zeros((self.rows, self.columns), dtype=numpy.uint8)
+
+        for rect in rects:
+            if rect.width <= 0 or rect.height <= 0:
+                continue
+            # every cell the block touches
+            left = max(0, rect.left // cell_size)
+            top = max(0, rect.top // cell_size)
+            right = min(self.columns, -(-rect.right // cell_size))
+            bottom = min(self.rows, -(-rect.bottom // cell_size))
+            touched = self.cells[top:bottom, left:right]
+            touched[touched == self.EMPTY] = self.PARTIAL
+
+            # only the cells the block covers completely
+            left = max(0, -(-rect.left // cell_size))
+            top = max(0, -(-rect.top // cell_size))
+            right = min(self.columns, rect.right // cell_size)
+            bottom = min(self.rows, rect.bottom // cell_size)
+            if right > left and bottom > top:
+                self.cells[top:bottom, left:right] = self.SOLID
+
+        if tiles is not None:
+            rows = min(self.rows, tiles.rows)
+            columns = min(self.columns, tiles.columns)
+            self.cells[:rows, :columns][tiles.cells[:rows, :columns] != TileGrid.EMPTY] = self.SOLID
+
+    def area_max(self, left, top, right, bottom):
+        # Highest cell value anywhere under arrays of rects given by their inclusive pixel bounds.
+        # Points a cell apart from the top left corner, plus the far edges, hit every cell a rect covers.
+        size = self.cell_size
+        values = numpy.zeros(len(left), dtype=numpy.uint8)
+        for i in range(int((right - left).max()) // size + 2):
+            x = numpy.minimum(left + i * size, right)
+            for j in range(int((bottom - top).max()) // size + 2):
+                y = numpy.minimum(top + j * size, bottom)
+                values = numpy.maximum(values, self.lookup(x, y))
+        return values
+
+    def lookup(self, x, y):
+        # Cell values under arrays of points, points off the grid count as EMPTY
+        column = x // self.cell_size
+        row = y // self.cell_size
+        inside = (column >= 0) & (column < self.columns) & (row >= 0) & (row < self.rows)
+        values = numpy.zeros(len(x), dtype=numpy.uint8)
+        values[inside] = self.cells[row[inside], column[inside]]
+        return values
+
+
+class TileGrid:
+    # Collision straight from the tile layers, see tilemap.tile_blocks. One byte per tile holding the
+    # BlockType id of the tile there or EMPTY, so plain terrain needs no hand placed Block objects and finding
+    # the block at a tile is a single array lookup. Special blocks like bounce and death still come from
+    # objects, and the two work side by side through blocks_near.
+    EMPTY = 255
+
+    def __init__(self, cells, tilewidth, tileheight):
+        self.cells = cells
+        self.rows, self.columns = cells.shape
+        self.tilewidth = tilewidth
+        self.tileheight = tileheight
+        # the Block of each (row, column) asked for so far, only tiles something came near ever get one
+        self.blocks = {}
+
+    def blocks_in(self, rect):
+        # The Block of every non empty tile rect overlaps or touches
+        first_x = max(0, rect.left // self.tilewidth)
+        first_y = max(0, rect.top // self.tileheight)
+        last_x = min(self.columns - 1, max(rect.right - 1, rect.left) // self.tilewidth)
+        last_y = min(self.rows - 1, max(rect.bottom - 1, rect.top) // self.tileheight)
+        if last_x < first_x or last_y < first_y:
+            return []
+        area = self.cells[first_y:last_y + 1, first_x:last_x + 1]
+        rows, columns = numpy.nonzero(area != self.EMPTY)
+        found = []
+        for y, x in zip((rows + first_y).tolist(), (columns + first_x).tolist()):
+            block = self.blocks.get((y, x))
+            if block is None:
+                block = sprites.Block(x * self.tilewidth, y * self.tileheight, self.tilewidth, self.tileheight,
+                                      int(self.cells[y, x]), None)
+                self.blocks[(y, x)] = block
+            found.append(block)
+        return found
+
+
+def check_tile_size(tiles, cell_size):
+    # Tiles get copied straight into the cells of the batch grids, which only works when they're the same size
+    if tiles is not None and (tiles.tilewidth, tiles.tileheight) != (cell_size, cell_size):
+        raise ValueError('{}x{} tiles don\'t fit a grid of {}px cells'.format(tiles.tilewidth, tiles.tileheight,
+                                                                             cell_size))
+
+
+class StaticGrid:
+    # Every static block of a level in flat NumPy arrays, plus a tile sized grid of which blocks touch each
+    # cell, so collision tests for a whole batch of moving rects run as array operations (see physics.py).
+    # Blocks are numbered in level order like blocks_near hands them out: object blocks first, then one per
+    # non empty tile in row order. Object blocks keep their own rects however many cells they cover.
+    # The grid can also cover just the part of the level from left, top on, then only what is in there counts.
+    DIRECTIONS = (None, 'up', 'down', 'left', 'right')
+
+    def __init__(self, width, height, specs, tiles=None, cell_size=settings.TILESIZE, left=0, top=0):
+        # specs are the level's (x, y, w, h, (block type id, direction)) in level order, tiles is the level's
+        # TileGrid if it has one, its tiles have to be cell_size
+        check_tile_size(tiles, cell_size)
+        self.cell_size = cell_size
+        self.first_column = left // cell_size
+        self.first_row = top // cell_size
+        self.columns = -(-(left + width) // cell_size) - self.first_column
+        self.rows = -(-(top + height) // cell_size) - self.first_row
+
+        rects = [pygame.Rect(x, y, w, h) for x, y, w, h, key in specs]
+        types = [key[0] for x, y, w, h, key in specs]
+        directions = [self.DIRECTIONS.index(key[1]) for x, y, w, h, key in specs]
+        touching = {}
+        for index, rect in enumerate(rects):
+            if rect.width <= 0 or rect.height <= 0:
+                continue
+            for x in range(max(0, rect.left // cell_size - self.first_column),
+                           min(self.columns, -(-rect.right // cell_size) - self.first_column)):
+                for y in range(max(0, rect.top // cell_size - self.first_row),
+                               min(self.rows, -(-rect.bottom // cell_size) - self.first_row)):
+                    touching.setdefault((y, x), []).append(index)
+
+        # rows and columns of the tiles in the grid's own cells, moved back out to level ones further down
+        tile_rows = tile_columns = numpy.zeros(0, dtype=numpy.int64)
+        if tiles is not None:
+            area = tiles.cells[self.first_row:self.first_row + self.rows,
+                               self.first_column:self.first_column + self.columns]
+            tile_rows, tile_columns = numpy.nonzero(area != TileGrid.EMPTY)
+
+        depth = max([len(found) for found in touching.values()] + [0]) + (len(tile_rows) > 0)
+        self.cells = numpy.full((self.rows, self.columns, max(depth, 1)), -1, dtype=numpy.int32)
+        for (y, x), found in touching.items():
+            self.cells[y, x, :len(found)] = found
+        first_tile = len(rects)
+        self.cells[tile_rows, tile_columns, -1] = numpy.arange(first_tile, first_tile + len(tile_rows))
+        tile_rows = tile_rows + self.first_row
+        tile_columns = tile_columns + self.first_column
+
+        self.left = numpy.array([rect.left for rect in rects] + (tile_columns * cell_size).tolist(), dtype=numpy.int64)
+        self.top = numpy.array([rect.top for rect in rects] + (tile_rows * cell_size).tolist(), dtype=numpy.int64)
+        self.right = self.left + numpy.array([rect.width for rect in rects] + [cell_size] * len(tile_rows),
+                                             dtype=numpy.int64)
+        self.bottom = self.top + numpy.array([rect.height for rect in rects] + [cell_size] * len(tile_rows),
+                                             dtype=numpy.int64)
+        tile_types = tiles.cells[tile_rows, tile_columns].tolist() if tiles is not None else []
+        self.types = numpy.array(types + tile_types, dtype=numpy.int64)
+        self.directions = numpy.array(directions + [0] * len(tile_rows), dtype=numpy.int64)
+
+    def near(self, left, top, right, bottom):
+        # Indices of the blocks in every cell each rect overlaps or touches, one row per rect padded with -1.
+        # Rects are arrays of edges like pygame's, right and bottom just outside. Candidates only, some come
+        # back more than once, and callers still do their own exact tests.
+        size = self.cell_size
+        first_x = left // size - self.first_column
+        first_y = top // size - self.first_row
+        last_x = numpy.maximum(right - 1, left) // size - self.first_column
+        last_y = numpy.maximum(bottom - 1, top) // size - self.first_row
+        across = int((last_x - first_x).max()) + 1
+        down = int((last_y - first_y).max()) + 1
+
+        columns = (first_x[:, None] + numpy.arange(across))[:, None, :]
+        rows = (first_y[:, None] + numpy.arange(down))[:, :, None]
+        inside = (columns <= last_x[:, None, None]) & (rows <= last_y[:, None, None]) & \
+                 (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+        found = self.cells[numpy.where(inside, rows, 0), numpy.where(inside, columns, 0)]
+        found[~inside] = -1
+        return found.reshape(len(left), -1)
+
+
+def blocks_near(game, rect):
+    # Every block that could touch rect: object blocks from the collision index in level order, then tiles
+    blocks = game.collision_index.query(rect, game.blocks)
+    if game.tile_grid is not None:
+        blocks.extend(game.tile_grid.blocks_in(rect))
+    return blocks
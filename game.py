@@ -1,131 +1,263 @@
+import logging
 import pygame
 from os import path
 import settings
 import player
 import sprites
 import tilemap
+import collision
+import inputs
+import profiler
+import preload
+import projectiles
+import streaming
+import textcache
+
+log = logging.getLogger(__name__)
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, headless=settings.HEADLESS, joystick=None, record=None, replay=None, trace=None):
         pygame.init()
-        self.screen = pygame.display.set_mode((settings.WIDTH, settings.HEIGHT), pygame.FULLSCREEN)
+        self.headless = headless
+        if headless:
+            self.screen = pygame.display.set_mode((settings.WIDTH, settings.HEIGHT))
+        else:
+            self.screen = pygame.display.set_mode((settings.WIDTH, settings.HEIGHT), pygame.FULLSCREEN)
         self.clock = pygame.time.Clock()
         self.debug = False
 
         joysticks = [pygame.joystick.Joystick(x) for x in range(pygame.joystick.get_count())]
-        if joysticks:
+        if joystick is not None:
+            self.joystick = joystick
+            self.joystick_enabled = True
+        elif joysticks and not headless:
             self.joystick = joysticks[0]
             self.joystick.init()
             self.joystick_enabled = True
+        elif headless:
+            self.joystick = inputs.ScriptedJoystick()
+            self.joystick_enabled = True
         else:
+            self.joystick = None
             self.joystick_enabled = False
 
+        # the controller is read once per step into self.controls, which is all the gameplay code looks at
+        self.input = inputs.InputSystem(self.joystick, record=record, replay=replay)
+        self.controls = inputs.InputFrame()
+        # per frame timings for the debug overlay, trace is a .csv or .json file to write them all to
+        self.profiler = profiler.FrameProfiler(trace_file=trace)
+
         self.running = True
+        # validation runs switch this off so going through an exit only sets completed_frame
+        self.advance_levels = True
+        self.completed_frame = None
         self.load_data()
+        # the next level gets parsed and baked on a worker thread while the current one is played
+        self.loader = preload.LevelLoader()
 
     def new(self):
         self.all_sprites = pygame.sprite.Group()
         self.player_sprites = pygame.sprite.Group()
-        self.blocks = pygame.sprite.Group()
-        self.walls = pygame.sprite.Group()
-        self.platforms = pygame.sprite.Group()
+        # blocks aren't sprites, see sprites.Block, this is just the set of the ones currently loaded
+        self.blocks = set()
         self.interactables = pygame.sprite.Group()
         self.abilities = pygame.sprite.Group()
-        self.bullets = pygame.sprite.Group()
+        self.bullets = projectiles.BulletManager(self)
 
         self.levels = ['Map1.tmx', 'Map2.tmx', 'testmap.tmx']
         self.player = player.Player(self, 0, 0, )
 
-        self.level_number = 0
+        self.previous_positions = {}
+        # dirty rect rendering remembers what the last frame drew, see draw_frame
+        self.dirty_rects = settings.DIRTY_RECTS
+        self.last_background = None
+        self.last_blits = []
+        self.last_energy = None
+        self.bar_rect = None
+        # (text, y, last frame) of the messages on screen, drawn with the HUD, see message_blits
+        self.messages = []
+        self.level_number = self.input.start(0)
+        self.spawn = (0, 0)
         self.load_level(self.levels[self.level_number])
 
     def run(self):
         # Game Loop
+        # The simulation always moves in steps of 1 / FPS seconds. Rendering runs on its own, and draws
+        # everything part way between the last two steps, so a slow frame only costs smoothness and the
+        # game catches up with a few extra steps instead of slowing down.
         self.playing = True
+        step_time = 1000.0 / settings.FPS
+        accumulator = 0.0
         while self.playing:
-            self.dt = self.clock.tick(settings.FPS) / 1000.0
-            self.clock.tick(settings.FPS)
+            self.dt = self.clock.tick(settings.RENDER_FPS) / 1000.0
+            accumulator += self.dt * 1000.0
+
+            steps = 0
+            while accumulator >= step_time and self.playing:
+                with self.profiler.section('events'):
+                    self.events()
+                self.update()
+                accumulator -= step_time
+                steps += 1
+                if steps == settings.MAX_FRAME_STEPS:
+                    # too far behind to catch up, drop the rest rather than spiralling
+                    accumulator = 0.0
+
+            self.draw(accumulator / step_time)
+            self.profiler.end_frame()
+
+    def get_ticks(self):
+        # game time in milliseconds, advanced once per frame by the input system so replays see the same times
+        return self.input.ticks
+
+    def step(self):
+        # One frame of the game without drawing or waiting on the clock, used by headless runs
+        if hasattr(self.joystick, 'step'):
+            self.joystick.step()
+        with self.profiler.section('events'):
             self.events()
-            self.update()
-            self.draw()
+        self.update()
+
+    def run_headless(self, frames):
+        # Step up to frames frames as fast as possible, returns how many ran before the game quit
+        # or the replay being played back ran out
+        self.playing = True
+        for frame in range(frames):
+            if not self.playing or self.input.finished:
+                return frame
+            self.step()
+            self.profiler.end_frame()
+        return frames
 
     def load_data(self):
         # Easy names for file directories
         self.game_folder = path.dirname(__file__)
         self.img_folder = path.join(self.game_folder, 'img')
         self.map_folder = path.join(self.game_folder, 'maps')
-
-        self.idle_spritesheet = player.Spritesheet(path.join(self.img_folder, "player_idle.png"))
-        self.walk_spritesheet = player.Spritesheet(path.join(self.img_folder, "player_walking.png"))
-        self.run_spritesheet = player.Spritesheet(path.join(self.img_folder, "player_running.png"))
-        self.jump_spritesheet = player.Spritesheet(path.join(self.img_folder, "player_jumping.png"))
-        self.double_jump_spritesheet = player.Spritesheet(path.join(self.img_folder, "player_double_jumping.png"))
-        self.wall_slide_spritesheet = player.Spritesheet(path.join(self.img_folder, "player_wall_slide.png"))
-        self.sword_attack_spritesheet = player.Spritesheet(path.join(self.img_folder, "player_attack.png"))
-        self.sword_thrust_spritesheet = player.Spritesheet(path.join(self.img_folder, "player_thrust.png"))
-        self.teleport_spritesheet = player.Spritesheet(path.join(self.img_folder, "player_teleport.png"))
-        self.ranged_attack_spritesheet = player.Spritesheet(path.join(self.img_folder, "player_ranged_attack.png"))
-        self.red_bullet_spritesheet = player.Spritesheet(path.join(self.img_folder, "red_ball_bullet.png"))
+        self.cache_folder = path.join(self.game_folder, 'cache')
 
         self.yellow_bullet_img = pygame.image.load(path.join(self.img_folder, "neon_yellow_ball.png")).convert_alpha()
         self.button_up_img = pygame.image.load(path.join(self.img_folder, "button_up.png")).convert_alpha()
         self.button_down_img = pygame.image.load(path.join(self.img_folder, "button_down.png")).convert_alpha()
 
     def load_level(self, mapname):
-        self.map = tilemap.Map(path.join(self.map_folder, mapname))
-        self.map_img = self.map.make_map()
-        self.map_rect = self.map_img.get_rect()
+        self.map_path = path.join(self.map_folder, mapname)
+        baked = self.loader.take(self.map_path, self.show_loading)
+        self.map = tilemap.Map(self.map_path, self.cache_folder, baked)
+        self.map_renderer = tilemap.ChunkedMapRenderer(self.map)
         self.initialize_level()
 
+        if self.level_number + 1 < len(self.levels):
+            self.loader.prefetch(path.join(self.map_folder, self.levels[self.level_number + 1]), self.cache_folder)
+
+    def show_loading(self):
+        # Only shows up when a level is needed before the worker has it ready
+        self.screen.fill(settings.BLACK)
+        self.draw_text('Loading...', 30, settings.WHITE, settings.WIDTH / 2, settings.HEIGHT / 2, True)
+        pygame.display.flip()
+        pygame.event.pump()
+        self.last_background = None
+
     def initialize_level(self):
-        for tile_object in self.map.tmxdata.objects:
+        self.collision_index = collision.SpatialHash(settings.TILESIZE)
+        block_specs = []
+        interactable_specs = []
+        for tile_object in self.map.objects:
             if tile_object.type == 'Player':
-                self.player.position.x = tile_object.x
-                self.player.position.y = tile_object.y
-                self.player.hit_rect.x = tile_object.x
-                self.player.hit_rect.y = tile_object.y
+                self.spawn = (tile_object.x, tile_object.y)
+                self.place_player(*self.spawn)
             if tile_object.type == 'Block':
                 if tile_object.name == 'bounce':
                     direction = tile_object.Direction
                 else:
                     direction = None
-                sprites.Block(self, tile_object.x, tile_object.y, tile_object.width, tile_object.height,
-                              tile_object.name, direction)
+                key = (sprites.BLOCK_TYPE_IDS[tile_object.name], direction)
+                block_specs.append((tile_object.x, tile_object.y, tile_object.width, tile_object.height, key))
             if tile_object.type == 'Interactable':
                 if tile_object.name == 'button':
                     ability = tile_object.Ability
                 else:
                     ability = None
+                interactable_specs.append((tile_object.x, tile_object.y, tile_object.width, tile_object.height,
+                                           (tile_object.name, ability)))
+
+        # touching blocks of the same kind get merged so every collision loop has fewer rects to go through
+        merged_specs = collision.merge_blocks(block_specs)
+        log.info('%s: merged %d blocks into %d, removed %d', path.basename(self.map_path), len(block_specs),
+                  len(merged_specs), len(block_specs) - len(merged_specs))
+
+        # solid terrain can also come straight from tile properties in the tilesets, see tilemap.tile_blocks
+        self.tile_grid = None
+        if self.map.tile_blocks is not None:
+            self.tile_grid = collision.TileGrid(self.map.tile_blocks, self.map.tilewidth, self.map.tileheight)
+        # the batch grids use the map's tiles as cells, so tile collision drops straight into them
+        self.collision_grid = collision.BlockGrid(self.map.width, self.map.height,
+                                                  [pygame.Rect(x, y, w, h) for x, y, w, h, key in merged_specs],
+                                                  cell_size=self.map.tilewidth, tiles=self.tile_grid)
+        # blocks and interactables only exist in the sectors around the player, see streaming.py
+        self.streamer = streaming.SectorStreamer(self, interactable_specs, merged_specs)
+        self.streamer.update(self.player.hit_rect.center)
+        self.camera = tilemap.Camera(self.map.width, self.map.height)
 
-                sprites.Interactable(self, tile_object.x, tile_object.y, tile_object.width, tile_object.height,
-                                     tile_object.name, self.button_down_img, self.button_up_img, ability)
+    def place_player(self, x, y):
+        self.player.position.x = x
+        self.player.position.y = y
+        self.player.hit_rect.x = x
+        self.player.hit_rect.y = y
 
-        self.camera = tilemap.Camera(self.map.width, self.map.height)
+    def clear_level(self):
+        self.bullets.clear()
+        self.streamer.clear()
+        self.interactables.empty()
+        self.blocks.clear()
+
+    def complete_level(self):
+        # The player went through the exit
+        self.completed_frame = self.input.frame_number
+        if self.advance_levels:
+            self.next_level()
 
-    # Combine next_level and restart_level into one
     def next_level(self):
-        self.interactables.empty()
-        self.blocks.empty()
-        self.bullets.empty()
+        self.clear_level()
         self.level_number += 1
         self.load_level(self.levels[self.level_number])
 
     def restart_level(self):
-        self.interactables.empty()
-        self.blocks.empty()
-        self.bullets.empty()
-        self.load_level(self.levels[self.level_number])
+        # Put the level back the way it started in place. The map, its rendered chunks and the collision index
+        # are all reused, only the things that can change during play get reset.
+        self.bullets.clear()
+        self.streamer.reset()
+        self.place_player(*self.spawn)
+        self.streamer.update(self.player.hit_rect.center)
+        self.camera = tilemap.Camera(self.map.width, self.map.height)
 
     def update(self):
+        # remember where everything was so draw can interpolate towards where it ends up
+        self.previous_positions = {sprite: sprite.rect.topleft for sprite in self.all_sprites}
+        for sprite in self.player_sprites:
+            self.previous_positions[sprite] = sprite.rect.topleft
+
+        with self.profiler.section('update.streaming'):
+            self.streamer.update(self.player.hit_rect.center)
+
         # stop using all_sprites eventually for more control over how everything updates
-        self.all_sprites.update()
-        self.player_sprites.update()
-        self.interactables.update()
-        self.camera.update(self.player)
+        with self.profiler.section('update.all_sprites'):
+            self.all_sprites.update()
+        with self.profiler.section('update.bullets'):
+            self.bullets.update()
+        with self.profiler.section('update.player_sprites'):
+            self.player_sprites.update()
+        with self.profiler.section('update.interactables'):
+            self.interactables.update()
+        with self.profiler.section('update.camera'):
+            self.camera.update(self.player)
 
     def events(self):
-        for event in pygame.event.get():
+        events = pygame.event.get()
+        self.controls = self.input.sample(events)
+
+        for event in events:
 
             if event.type == pygame.QUIT:
                 if self.playing:
@@ -142,74 +274,169 @@ class Game:
                 if event.key == pygame.K_TAB:
                     self.show_debug()
 
-            if event.type == pygame.JOYBUTTONDOWN:
-
-                # this might need to be cleaned up a bit
-                if event.button == settings.JOYBUTTONS['A']:
-                    if self.joystick.get_axis(settings.JOYAXIS['LeftVertical']) > 0.85:
-                        self.player.platform_drop()
-                    elif self.player.wall_grabbing and self.player.check_airborne() and self.player.current_energy > 0:
-                        self.player.wall_jump()
-                    elif not self.player.check_airborne():
-                        self.player.jump()
-                    elif self.player.check_airborne() and self.player.can_double_jump and not self.player.double_jumping:
-                        self.player.double_jump()
-
-                if event.button == settings.JOYBUTTONS['B']:
-                    if self.player.ranged_attacking is False:
-                        self.player.ranged_attack()
-
-                if event.button == settings.JOYBUTTONS['X']:
-                    pass
-                    # turned off melee attack until animation is better
-                    #if self.player.sword_attacking is False:
-                        #self.player.thrust_attack()
-
-                if event.button == settings.JOYBUTTONS['Y']:
-                    for object in self.interactables:
-                        if object.name == 'exit' and self.player.rect.colliderect(object.rect):
-                                self.next_level()
-                        if object.name == 'button' and self.player.rect.colliderect(object.rect):
-                            object.state = not object.state
-                            if object.ability == 'Double Jump':
-                                self.player.can_double_jump = True
-                                self.draw_text('You Gained Double Jump!', 18, settings.WHITE, 150, 100, True)
-                            if object.ability == 'Sprint':
-                                self.player.can_sprint = True
-                                self.draw_text('You Gained Sprint!', 18, settings.WHITE, 150, 150, True)
-
-                if event.button == settings.JOYBUTTONS['LeftBumper']:
-                    if self.player.can_teleport:
-                        self.player.joystick_teleport('left')
-
-                if event.button == settings.JOYBUTTONS['RightBumper']:
-                    if self.player.can_teleport:
-                        self.player.joystick_teleport('right')
-
-            if event.type == pygame.JOYBUTTONUP:
-                if event.button == settings.JOYBUTTONS['A']:
-                    self.player.jump_cut()
-
-    def draw(self):
-        self.screen.blit(self.map_img, self.camera.apply_rect(self.map_rect))
-
-        for sprite in self.all_sprites:
-            self.screen.blit(sprite.image, self.camera.apply(sprite))
+        self.button_actions(self.controls)
+
+    def button_actions(self, controls):
+        # this might need to be cleaned up a bit
+        if controls.was_pressed('A'):
+            if controls.get_axis(settings.JOYAXIS['LeftVertical']) > 0.85:
+                self.player.platform_drop()
+            elif self.player.wall_grabbing and self.player.check_airborne() and self.player.current_energy > 0:
+                self.player.wall_jump()
+            elif not self.player.check_airborne():
+                self.player.jump()
+            elif self.player.check_airborne() and self.player.can_double_jump and not self.player.double_jumping:
+                self.player.double_jump()
+
+        if controls.was_pressed('B'):
+            if self.player.ranged_attacking is False:
+                self.player.ranged_attack()
+
+        if controls.was_pressed('X'):
+            pass
+            # turned off melee attack until animation is better
+            #if self.player.sword_attacking is False:
+                #self.player.thrust_attack()
+
+        if controls.was_pressed('Y'):
+            for object in self.collision_index.query(self.player.rect, self.interactables):
+                if object.name == 'exit' and self.player.rect.colliderect(object.rect):
+                        self.complete_level()
+                if object.name == 'button' and self.player.rect.colliderect(object.rect):
+                    object.state = not object.state
+                    if object.ability == 'Double Jump':
+                        self.player.can_double_jump = True
+                        self.show_message('You Gained Double Jump!', 100)
+                    if object.ability == 'Sprint':
+                        self.player.can_sprint = True
+                        self.show_message('You Gained Sprint!', 150)
+
+        if controls.was_pressed('LeftBumper'):
+            if self.player.can_teleport:
+                self.player.joystick_teleport('left')
+
+        if controls.was_pressed('RightBumper'):
+            if self.player.can_teleport:
+                self.player.joystick_teleport('right')
+
+        if controls.was_released('A'):
+            self.player.jump_cut()
+
+    def show_message(self, text, y):
+        # Text at y that stays up for MESSAGE_FRAMES frames. It's drawn in draw_frame like everything else so
+        # dirty rect rendering knows when it appears and goes away.
+        self.messages = [message for message in self.messages if message[1] != y]
+        self.messages.append((text, y, self.input.frame_number + settings.MESSAGE_FRAMES))
+
+    def message_blits(self):
+        self.messages = [message for message in self.messages if message[2] > self.input.frame_number]
+        blits = []
+        for text, y, last_frame in self.messages:
+            image = textcache.cache.render(text, 18, settings.WHITE)
+            blits.append((image, image.get_rect(midtop=(150, y)).topleft))
+        return blits
+
+    def draw(self, alpha=1.0):
+        # alpha is how far between the previous and the latest simulation step to draw things
+        with self.profiler.section('draw'):
+            dirty = self.draw_frame(alpha)
 
-        for sprite in self.interactables:
-            self.screen.blit(sprite.image, self.camera.apply(sprite))
+        # display frame
+        with self.profiler.section('flip'):
+            if dirty is None:
+                pygame.display.flip()
+            elif dirty:
+                pygame.display.update(dirty)
+
+    def draw_frame(self, alpha):
+        # Draws the frame and returns the screen rects that changed, or None if the whole screen was redrawn
+        self.camera.interpolate(alpha)
+        blits = self.visible_sprites(alpha) + self.message_blits()
+        energy = self.player.current_energy / self.player.max_energy
+
+        # With dirty rects on, the screen from last frame is reused as long as the map behind it hasn't
+        # scrolled. The debug overlay changes every frame so it always gets the full redraw.
+        background = (self.map_renderer, self.camera.offset)
+        dirty = None
+        if self.dirty_rects and not self.debug and background == self.last_background:
+            dirty = self.find_dirty(blits, energy)
+        self.last_background = background if self.dirty_rects and not self.debug else None
+        self.last_blits = blits
+        self.last_energy = energy
+
+        if dirty is None:
+            self.map_renderer.draw(self.screen, self.camera)
+            self.screen.blits(blits, False)
+            self.bar_rect = self.draw_bar(5, 5, energy)
+
+            # everything you want to see when debugging / Toggle with TAB
+            if self.debug:
+                self.draw_debug()
+            return None
+
+        # each changed area gets its piece of the map back, then every sprite touching it drawn over again
+        for rect in dirty:
+            self.screen.set_clip(rect)
+            self.map_renderer.draw(self.screen, self.camera, rect)
+            self.screen.blits([blit for blit in blits if rect.colliderect(blit[0].get_rect(topleft=blit[1]))],
+                              False)
+        self.screen.set_clip(None)
+        if self.bar_rect.collidelist(dirty) != -1:
+            self.draw_bar(5, 5, energy)
+        return dirty
+
+    def visible_sprites(self, alpha):
+        # (image, screen position) of everything on screen, in drawing order
+        # Moving sprites are tested with some margin since they get drawn a little behind where they are.
+        view = self.camera.get_viewport()
+        moving_view = view.inflate(2 * settings.INTERPOLATION_SNAP, 2 * settings.INTERPOLATION_SNAP)
+        offset_x, offset_y = self.camera.offset
+        blits = []
 
-        for sprite in self.player_sprites:
-            self.screen.blit(sprite.image, self.camera.apply(sprite))
+        for sprite in self.all_sprites:
+            if moving_view.colliderect(sprite.rect):
+                blits.append((sprite.image, self.interpolate(sprite, alpha)))
 
-        self.draw_bar(5, 5, self.player.current_energy / self.player.max_energy)
+        blits.extend(self.bullets.visible(self.camera, alpha))
 
-        # everything you want to see when debugging / Toggle with TAB
-        if self.debug:
-            self.draw_debug()
+        # Only the interactables near the player are loaded at all, so scanning them beats a grid query over
+        # the whole viewport, and keeps drawing out of the collision counters. Level order like the index.
+        shown = [sprite for sprite in self.interactables if view.colliderect(sprite.rect)]
+        for sprite in sorted(shown, key=self.collision_index.order.__getitem__):
+            blits.append((sprite.image, (sprite.rect.x + offset_x, sprite.rect.y + offset_y)))
 
-        # display frame
-        pygame.display.flip()
+        for sprite in self.player_sprites:
+            if moving_view.colliderect(sprite.rect):
+                blits.append((sprite.image, self.interpolate(sprite, alpha)))
+        return blits
+
+    def find_dirty(self, blits, energy):
+        # Screen rects of everything that appeared, moved, changed image or went away since the last frame,
+        # or None when so much changed that redrawing the whole screen is simpler
+        screen = self.screen.get_rect()
+        dirty = []
+        for image, position in set(blits).symmetric_difference(self.last_blits):
+            rect = image.get_rect(topleft=position).clip(screen)
+            if rect:
+                dirty.append(rect)
+        if energy != self.last_energy:
+            dirty.append(self.bar_rect)
+        if len(dirty) > settings.DIRTY_RECT_LIMIT:
+            return None
+        return dirty
+
+    def interpolate(self, sprite, alpha):
+        # Screen position of a sprite between its last two simulated positions
+        x = sprite.rect.x + self.camera.offset[0]
+        y = sprite.rect.y + self.camera.offset[1]
+        previous = self.previous_positions.get(sprite)
+        if previous is None or alpha >= 1.0:
+            return x, y
+        dx = sprite.rect.x - previous[0]
+        dy = sprite.rect.y - previous[1]
+        if abs(dx) > settings.INTERPOLATION_SNAP or abs(dy) > settings.INTERPOLATION_SNAP:
+            return x, y
+        return x - round(dx * (1 - alpha)), y - round(dy * (1 - alpha))
 
     def draw_bar(self, x, y, percentage):
         color = settings.BLUE
@@ -223,10 +450,10 @@ class Game:
         pygame.draw.rect(self.screen, settings.BLACK, outline_rect)
         pygame.draw.rect(self.screen, color, filled_rect)
         pygame.draw.rect(self.screen, settings.WHITE, outline_rect, 2)
+        return outline_rect
 
     def draw_text(self, text, size, color, x, y, centered):
-        font = pygame.font.Font(settings.FONT, size)
-        text_surface = font.render(text, True, color)
+        text_surface = textcache.cache.render(text, size, color)
         text_rect = text_surface.get_rect()
         text_rect.x = x
         text_rect.y = y
@@ -237,16 +464,20 @@ class Game:
     # this needs to be cleaned up
     # probably introduce a state machine soon
     def show_start_screen(self):
+        # none of the text changes, so it is put together once and drawn with a single blit
+        text = textcache.TextLayer()
+        text.set('title', settings.TITLE, 60, settings.WHITE, settings.WIDTH / 2, settings.HEIGHT / 4, True)
+        text.set('play', 'Press a joystick button to play', 30, settings.WHITE, settings.WIDTH / 2,
+                 settings.HEIGHT / 2, True)
+        text.set('quit', 'Press the escape button to quit', 20, settings.WHITE, settings.WIDTH / 2,
+                 settings.HEIGHT / 2 + 50, True)
+
         waiting = True
         while waiting:
             self.clock.tick(settings.FPS)
 
             # Draw All Text To Screen
-            self.draw_text(settings.TITLE, 60, settings.WHITE, settings.WIDTH / 2, settings.HEIGHT / 4, True)
-            self.draw_text('Press a joystick button to play', 30, settings.WHITE, settings.WIDTH / 2,
-                           settings.HEIGHT / 2, True)
-            self.draw_text('Press the escape button to quit', 20, settings.WHITE, settings.WIDTH / 2,
-                           settings.HEIGHT / 2 + 50, True)
+            text.draw(self.screen)
             pygame.display.flip()
 
             for event in pygame.event.get():
@@ -262,8 +493,12 @@ class Game:
                 if event.type == pygame.JOYBUTTONDOWN:
                     waiting = False
 
+        # the start screen is still on the display, so the game has to redraw all of it
+        self.last_background = None
+
     def show_debug(self):
         self.debug = not self.debug
 
     def draw_debug(self):
-        self.screen.blit(self.player.hit_image, self.camera.apply_rect(self.player.hit_rect))
\ No newline at end of file
+        self.screen.blit(self.player.hit_image, self.camera.apply_rect(self.player.hit_rect))
+        self.profiler.draw(self.screen, settings.WIDTH - self.profiler.size - 10, 10)
\ No newline at end of file
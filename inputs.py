@@ -0,0 +1,160 @@
+import os
+import struct
+import pygame
+import settings
+
+
+class ScriptedJoystick:
+    # Stands in for a pygame joystick when there is no controller, e.g. in headless runs.
+    # script maps a frame number to what changes on that frame:
+    #     {0: {'axes': {'LeftHorizontal': 1.0}}, 30: {'press': ['A']}, 34: {'release': ['A']}}
+    # Axes keep their value until changed again. Presses and releases are posted as the same
+    # JOYBUTTONDOWN / JOYBUTTONUP events a real controller sends, so Game.events handles them as usual.
+    def __init__(self, script=None):
+        self.script = script or {}
+        self.axes = [0.0] * len(settings.JOYAXIS)
+        self.buttons = [False] * len(settings.JOYBUTTONS)
+        self.frame = 0
+
+    def init(self):
+        pass
+
+    def get_numaxes(self):
+        return len(self.axes)
+
+    def get_numbuttons(self):
+        return len(self.buttons)
+
+    def get_axis(self, axis):
+        return self.axes[axis]
+
+    def get_button(self, button):
+        return self.buttons[button]
+
+    def step(self):
+        entry = self.script.get(self.frame)
+        if entry:
+            for name, value in entry.get('axes', {}).items():
+                self.axes[settings.JOYAXIS[name]] = value
+            for name in entry.get('press', ()):
+                self.buttons[settings.JOYBUTTONS[name]] = True
+                pygame.event.post(pygame.event.Event(pygame.JOYBUTTONDOWN, joy=0, instance_id=0,
+                                                     button=settings.JOYBUTTONS[name]))
+            for name in entry.get('release', ()):
+                self.buttons[settings.JOYBUTTONS[name]] = False
+                pygame.event.post(pygame.event.Event(pygame.JOYBUTTONUP, joy=0, instance_id=0,
+                                                     button=settings.JOYBUTTONS[name]))
+        self.frame += 1
+
+
+# Replay files: a header (magic, version, FPS, starting level) then one record per frame holding the
+# milliseconds since the previous frame, every axis as a signed 16 bit value, and bitmasks of the buttons
+# pressed and released that frame. Axes are stored at the same resolution SDL reads them at, and live play
+# uses the stored values too, so a replay feeds the game exactly what it saw while recording.
+REPLAY_MAGIC = b'PINP'
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct('<4sHHH')
+FRAME_RECORD = struct.Struct('<H{}hHH'.format(len(settings.JOYAXIS)))
+AXIS_SCALE = 32767
+
+
+class InputFrame:
+    # Everything the controller did during one frame. Player code reads axes through get_axis just like
+    # it would from a joystick, Game.events turns pressed and released into actions.
+    def __init__(self, elapsed=0, axes=None, pressed=0, released=0):
+        self.elapsed = elapsed
+        self.axes = axes or (0,) * len(settings.JOYAXIS)
+        self.pressed = pressed
+        self.released = released
+
+    def get_axis(self, axis):
+        return self.axes[axis] / AXIS_SCALE
+
+    def was_pressed(self, button):
+        return bool(self.pressed & (1 << settings.JOYBUTTONS[button]))
+
+    def was_released(self, button):
+        return bool(self.released & (1 << settings.JOYBUTTONS[button]))
+
+    def pack(self):
+        return FRAME_RECORD.pack(self.elapsed, *self.axes, self.pressed, self.released)
+
+    @staticmethod
+    def unpack(data):
+        values = FRAME_RECORD.unpack(data)
+        return InputFrame(values[0], values[1:-2], values[-2], values[-1])
+
+
+class InputSystem:
+    # Samples the controller once per frame into an InputFrame, and keeps the game clock.
+    # Can record every frame to a replay file, or play one back instead of reading the controller.
+    # The game simulates in fixed steps, so every frame lasts exactly 1 / FPS seconds of game time.
+    def __init__(self, joystick=None, record=None, replay=None):
+        self.joystick = joystick
+        self.record_file = open(record, 'wb') if record else None
+        self.replay_file = open(replay, 'rb') if replay else None
+        self.frame = InputFrame()
+        self.frame_number = 0
+        self.ticks = 0
+        self.finished = False
+
+    def start(self, level_number):
+        # Called when a game starts, returns the level to start on (the recorded one when replaying)
+        if self.replay_file:
+            magic, version, fps, level_number = REPLAY_HEADER.unpack(self.replay_file.read(REPLAY_HEADER.size))
+            if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+                raise ValueError('not a replay file: ' + self.replay_file.name)
+            self.replay_frames = (os.path.getsize(self.replay_file.name) - REPLAY_HEADER.size) // FRAME_RECORD.size
+            self.finished = self.replay_frames == 0
+        if self.record_file:
+            self.record_file.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, settings.FPS, level_number))
+        return level_number
+
+    def sample(self, events):
+        if self.replay_file:
+            data = self.replay_file.read(FRAME_RECORD.size)
+            if len(data) < FRAME_RECORD.size:
+                self.finished = True
+                frame = InputFrame(self.elapsed())
+            else:
+                frame = InputFrame.unpack(data)
+        else:
+            frame = self.read_device(events)
+
+        if self.record_file:
+            self.record_file.write(frame.pack())
+
+        self.frame = frame
+        self.frame_number += 1
+        self.ticks += frame.elapsed
+        if self.replay_file and self.frame_number >= self.replay_frames:
+            self.finished = True
+        return frame
+
+    def elapsed(self):
+        # whole milliseconds per step, spread so they add up to exactly 1000 every FPS steps
+        return (self.frame_number + 1) * 1000 // settings.FPS - self.frame_number * 1000 // settings.FPS
+
+    def read_device(self, events):
+        axes = [0] * len(settings.JOYAXIS)
+        if self.joystick is not None:
+            for axis in range(min(len(axes), self.joystick.get_numaxes())):
+                value = int(round(self.joystick.get_axis(axis) * AXIS_SCALE))
+                axes[axis] = max(-AXIS_SCALE, min(AXIS_SCALE, value))
+
+        pressed = released = 0
+        for event in events:
+            if event.type == pygame.JOYBUTTONDOWN and event.button < 16:
+                pressed |= 1 << event.button
+            if event.type == pygame.JOYBUTTONUP and event.button < 16:
+                released |= 1 << event.button
+
+        return InputFrame(self.elapsed(), tuple(axes), pressed, released)
+
+    def close(self):
+        if self.record_file:
+            self.record_file.close()
+            self.record_file = None
+        if self.replay_file:
+            self.replay_file.close()
+            self.replay_file = None
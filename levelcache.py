@@ -0,0 +1,232 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import zlib
+import numpy
+from os import path
+
+# Baked levels live in the cache folder as <tmx name>.<hash>.lvl
+# header: magic, version, pixel width, pixel height, tile width, tile height, length of the object blob,
+# length of the tile collision grid, chunk width, chunk height
+# then the object list as utf-8 json, then the tile collision grid (one byte per tile, empty if the level has
+# none), then an offset and length for every chunk in row order, then the rendered tile layers as one zlib
+# compressed block of RGB rows per chunk. Chunks are the size the map gets drawn in, see ChunkedMapRenderer,
+# so drawing a chunk unpacks exactly one of them.
+MAGIC = b'PLVL'
+VERSION = 3
+HEADER = struct.Struct('<4sIIIIIIIII')
+CHUNK_INDEX = numpy.dtype([('offset', '<u8'), ('length', '<u4')])
+COMPRESSION = 6
+
+SOURCE_PATTERN = re.compile(rb'source="([^"]+)"')
+
+# files written to the cache get the permissions anything else the process makes would get
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def source_files(filename, found=None):
+    # The tmx file plus every tileset and image it pulls in, following external .tsx files
+    if found is None:
+        found = []
+    filename = path.normpath(filename)
+    if filename in found or not path.isfile(filename):
+        return found
+    found.append(filename)
+
+    if filename.endswith(('.tmx', '.tsx')):
+        folder = path.dirname(filename)
+        with open(filename, 'rb') as f:
+            for source in SOURCE_PATTERN.findall(f.read()):
+                source_files(path.join(folder, source.decode('utf-8')), found)
+    return found
+
+
+def source_stats(sources):
+    stats = []
+    for source in sources:
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return None
+        stats.append([source, stat.st_size, stat.st_mtime_ns])
+    return stats
+
+
+def level_hash(filename, cache_folder=None):
+    # Content hash of the level and everything it pulls in. With a cache folder the hash is remembered there
+    # in <tmx name>.sources.json next to the size and modification time of every source, and as long as none
+    # of those changed it comes straight from there without reading any of the files.
+    record_file = None
+    if cache_folder:
+        name = path.splitext(path.basename(filename))[0]
+        record_file = path.join(cache_folder, name + '.sources.json')
+        try:
+            with open(record_file) as f:
+                record = json.load(f)
+            if record['filename'] == path.abspath(filename) and source_stats(
+                    [source for source, size, mtime in record['sources']]) == record['sources']:
+                return record['hash']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    sources = source_files(filename)
+    stats = source_stats(sources)
+    digest = hashlib.sha1()
+    for source in sources:
+        digest.update(path.basename(source).encode('utf-8'))
+        with open(source, 'rb') as f:
+            digest.update(f.read())
+    level = digest.hexdigest()
+
+    if record_file and stats is not None:
+        os.makedirs(cache_folder, exist_ok=True)
+        record = {'filename': path.abspath(filename), 'sources': stats, 'hash': level}
+        write_file(record_file, [json.dumps(record).encode('utf-8')])
+    return level
+
+
+def cache_path(cache_folder, filename):
+    name = path.splitext(path.basename(filename))[0]
+    return path.join(cache_folder, '{}.{}.lvl'.format(name, level_hash(filename, cache_folder)))
+
+
+def write_file(filename, parts):
+    # Writes the byte strings parts out to filename all at once. Every writer gets a temp file of its own, so
+    # processes writing the same file at once each write a whole one and the last to finish replaces the others'.
+    folder, name = path.split(filename)
+    f = tempfile.NamedTemporaryFile(dir=folder, prefix=name + '.', suffix='.tmp', delete=False)
+    try:
+        with f:
+            for part in parts:
+                f.write(part)
+        # temp files are only readable by their owner, the cache can be shared
+        os.chmod(f.name, 0o666 & ~UMASK)
+        os.replace(f.name, filename)
+    except BaseException:
+        os.remove(f.name)
+        raise
+
+
+class BakedLevel:
+    # A level read back from the cache. The chunks stay compressed in the memory mapped file until they
+    # actually get drawn.
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.width, self.height, self.tilewidth, self.tileheight, objects_length, grid_length, \
+            self.chunk_width, self.chunk_height = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('not a baked level: ' + filename)
+
+        start = HEADER.size
+        self.objects = json.loads(self.data[start:start + objects_length].decode('utf-8'))
+        start += objects_length
+
+        # copied out of the file, it's small and the map has to be able to close the file while it's in use
+        self.tile_blocks = None
+        if grid_length:
+            rows = -(-self.height // self.tileheight)
+            self.tile_blocks = numpy.frombuffer(self.data[start:start + grid_length], dtype=numpy.uint8)
+            self.tile_blocks = self.tile_blocks.reshape(rows, grid_length // rows).copy()
+        start += grid_length
+
+        self.columns = -(-self.width // self.chunk_width)
+        self.rows = -(-self.height // self.chunk_height)
+        count = self.columns * self.rows
+        self.chunks = numpy.frombuffer(self.data[start:start + count * CHUNK_INDEX.itemsize], dtype=CHUNK_INDEX)
+        last = self.chunks[-1] if count else None
+        if len(self.chunks) != count or (count and int(last['offset']) + int(last['length']) != len(self.data)):
+            self.close()
+            raise ValueError('truncated baked level: ' + filename)
+
+    def chunk_pixels(self, column, row):
+        # RGB pixels of one chunk as a (height, width, 3) array
+        entry = self.chunks[row * self.columns + column]
+        offset = int(entry['offset'])
+        pixels = zlib.decompress(self.data[offset:offset + int(entry['length'])])
+        width = min(self.chunk_width, self.width - column * self.chunk_width)
+        height = min(self.chunk_height, self.height - row * self.chunk_height)
+        return numpy.frombuffer(pixels, dtype=numpy.uint8).reshape(height, width, 3)
+
+    def read_area(self, area):
+        # RGB bytes for a rect of the level, which has to lie inside the level
+        first_x = area.left // self.chunk_width
+        first_y = area.top // self.chunk_height
+        last_x = (area.right - 1) // self.chunk_width
+        last_y = (area.bottom - 1) // self.chunk_height
+        if first_x == last_x and first_y == last_y:
+            pixels = self.chunk_pixels(first_x, first_y)
+            left = area.left - first_x * self.chunk_width
+            top = area.top - first_y * self.chunk_height
+            return pixels[top:top + area.height, left:left + area.width].tobytes()
+
+        result = numpy.empty((area.height, area.width, 3), dtype=numpy.uint8)
+        for row in range(first_y, last_y + 1):
+            for column in range(first_x, last_x + 1):
+                x = column * self.chunk_width
+                y = row * self.chunk_height
+                pixels = self.chunk_pixels(column, row)
+                part = area.clip(x, y, pixels.shape[1], pixels.shape[0])
+                result[part.top - area.top:part.bottom - area.top, part.left - area.left:part.right - area.left] = \
+                    pixels[part.top - y:part.bottom - y, part.left - x:part.right - x]
+        return result.tobytes()
+
+    def close(self):
+        self.chunks = None
+        self.data.close()
+        self.file.close()
+
+
+def load(cache_folder, filename):
+    # Returns the BakedLevel for filename, or None when there is no up to date one
+    baked = cache_path(cache_folder, filename)
+    if not path.isfile(baked):
+        return None
+    try:
+        return BakedLevel(baked)
+    except (ValueError, struct.error, OSError):
+        return None
+
+
+def save(cache_folder, filename, tilemap, objects, chunk_width, chunk_height, tile_blocks=None):
+    # Renders the level a row of chunks at a time so baking a huge map never needs the whole level in memory
+    # uncompressed. tilemap has to provide width, height, tilewidth, tileheight and render_strip(top, height) -> RGB
+    # bytes, tile_blocks is the level's uint8 tile collision grid if it has one
+    os.makedirs(cache_folder, exist_ok=True)
+    baked = cache_path(cache_folder, filename)
+
+    # old bakes of the same level are stale now, another process baking it may have got to them first
+    prefix = path.splitext(path.basename(filename))[0] + '.'
+    for old in os.listdir(cache_folder):
+        if old.startswith(prefix) and old.endswith('.lvl') and path.join(cache_folder, old) != baked:
+            try:
+                os.remove(path.join(cache_folder, old))
+            except FileNotFoundError:
+                pass
+
+    object_data = json.dumps(objects, separators=(',', ':'), default=str).encode('utf-8')
+    grid_data = b'' if tile_blocks is None else numpy.ascontiguousarray(tile_blocks, dtype=numpy.uint8).tobytes()
+    chunks = []
+    for top in range(0, tilemap.height, chunk_height):
+        height = min(chunk_height, tilemap.height - top)
+        strip = numpy.frombuffer(tilemap.render_strip(top, height), dtype=numpy.uint8)
+        strip = strip.reshape(height, tilemap.width, 3)
+        for left in range(0, tilemap.width, chunk_width):
+            chunks.append(zlib.compress(strip[:, left:left + chunk_width].tobytes(), COMPRESSION))
+
+    index = numpy.zeros(len(chunks), dtype=CHUNK_INDEX)
+    offset = HEADER.size + len(object_data) + len(grid_data) + index.nbytes
+    for i, chunk in enumerate(chunks):
+        index[i] = (offset, len(chunk))
+        offset += len(chunk)
+    header = HEADER.pack(MAGIC, VERSION, tilemap.width, tilemap.height, tilemap.tilewidth, tilemap.tileheight,
+                         len(object_data), len(grid_data), chunk_width, chunk_height)
+    write_file(baked, [header, object_data, grid_data, index.tobytes()] + chunks)
+    return baked
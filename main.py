@@ -1,8 +1,22 @@
+import os
 import game
+import settings
 
-app = game.Game()
+# PLATFORMER_RECORD=run.rep records the controller, PLATFORMER_REPLAY=run.rep plays a recording back
+# PLATFORMER_TRACE=frames.csv (or .json) writes every frame's timings out on exit
+app = game.Game(record=os.environ.get('PLATFORMER_RECORD'), replay=os.environ.get('PLATFORMER_REPLAY'),
+                trace=os.environ.get('PLATFORMER_TRACE'))
 app.new()
-app.show_start_screen()
 
-while app.running:
-    app.run()
+if settings.HEADLESS:
+    # PLATFORMER_HEADLESS=1 PLATFORMER_FRAMES=10000 python main.py
+    app.run_headless(int(os.environ.get('PLATFORMER_FRAMES', 3600)))
+else:
+    app.show_start_screen()
+
+    while app.running:
+        app.run()
+
+app.input.close()
+app.loader.close()
+app.profiler.dump()
@@ -0,0 +1,380 @@
+import heapq
+import json
+import math
+import sys
+import numpy
+from os import path
+import settings
+import collision
+import levelcache
+import physics
+import sprites
+import tilemap
+
+# Offline reachability analysis of a level. The standable surfaces of the level's blocks become the nodes of
+# a navigation graph, and the ways to get from one to another become its edges: falling off an edge,
+# jumping, double jumping and teleporting, each with the number of frames it takes and the abilities it
+# needs. Edges are found by trying every move from every surface with physics.PlayerBatch, so they follow
+# PLAYER_JUMP, GRAVITY_MAGNITUDE, TELEPORT_MAGNITUDE and the rest of the movement settings exactly.
+#     python navigation.py                  builds maps/<name>.nav.json for every map
+#     graph = navigation.get(map_file)      the saved graph, rebuilt first if the level or settings changed
+#     graph.find_path(graph.spawn, graph.exits[0], abilities=('double_jump',))
+# A* over the graph answers "can I get there and how" without simulating anything, for enemy AI and
+# completability checks.
+GAME_FOLDER = path.dirname(path.abspath(__file__))
+CACHE_FOLDER = path.join(GAME_FOLDER, 'cache')
+VERSION = 1
+ABILITIES = ('double_jump', 'sprint', 'teleport')
+
+MAX_FRAMES = 240                        # longest a single move is followed before giving up on it
+TAKEOFF_SPACING = 96                    # pixels between the standing jumps tried along a surface
+# running speeds where ground acceleration and friction cancel out, walking and sprinting
+WALK_SPEED = settings.PLAYER_ACCELERATION / -settings.WALL_FRICTION
+SPRINT_SPEED = 3 * WALK_SPEED
+
+# the moves tried from every takeoff: name, ability needed, frame A is let go, frame of the second jump,
+# frames of steering the stick towards the move's direction, frame of the teleport
+MOVES = [
+    ('fall',        None,          None, None, MAX_FRAMES, None),
+    ('jump',        None,          MAX_FRAMES, None, MAX_FRAMES, None),
+    ('jump',        None,          MAX_FRAMES, None, 6, None),
+    ('jump',        None,          4, None, MAX_FRAMES, None),
+    ('double_jump', 'double_jump', 7, 8, MAX_FRAMES, None),
+    ('double_jump', 'double_jump', 13, 14, MAX_FRAMES, None),
+    ('teleport',    'teleport',    None, None, MAX_FRAMES, 0),
+    ('teleport',    'teleport',    MAX_FRAMES, None, MAX_FRAMES, 8),
+]
+
+
+def level_objects(level):
+    # (block specs, spawn, exit rects) of a tilemap.Map, the same way Game.initialize_level reads them
+    specs = []
+    spawn = None
+    exits = []
+    for tile_object in level.objects:
+        if tile_object.type == 'Player':
+            spawn = (tile_object.x, tile_object.y)
+        if tile_object.type == 'Block':
+            direction = tile_object.Direction if tile_object.name == 'bounce' else None
+            specs.append((tile_object.x, tile_object.y, tile_object.width, tile_object.height,
+                          (sprites.BLOCK_TYPE_IDS[tile_object.name], direction)))
+        if tile_object.type == 'Interactable' and tile_object.name == 'exit':
+            exits.append((tile_object.x, tile_object.y, tile_object.x + tile_object.width,
+                          tile_object.y + tile_object.height))
+    return specs, spawn, exits
+
+
+def subtract(intervals, cut):
+    # Inclusive integer intervals minus another set of them
+    for cut_left, cut_right in cut:
+        pieces = []
+        for left, right in intervals:
+            if cut_right < left or cut_left > right:
+                pieces.append((left, right))
+                continue
+            if left < cut_left:
+                pieces.append((left, cut_left - 1))
+            if cut_right < right:
+                pieces.append((cut_right + 1, right))
+        intervals = pieces
+    return intervals
+
+
+def union(intervals):
+    merged = []
+    for left, right in sorted(intervals):
+        if merged and left <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], right))
+        else:
+            merged.append((left, right))
+    return merged
+
+
+def find_surfaces(grid, width):
+    # Every stretch the player can stand on, as (left, right, y): the range of hit box x positions and the
+    # height of the ground under it. The top of a wall, platform or sideways bounce block, minus wherever the
+    # hit box would be inside a solid or death block.
+    types = grid.types
+    standable = physics.WALL[types] | physics.PLATFORM[types] | \
+        (physics.BOUNCY[types] & (grid.directions != physics.UP))
+    blocking = physics.WALL[types] | physics.BOUNCY[types] | physics.DEATH[types]
+
+    surfaces = []
+    for y in numpy.unique(grid.top[standable]).tolist():
+        ground = standable & (grid.top == y)
+        supports = union(zip((grid.left[ground] - physics.HIT_WIDTH + 1).tolist(), (grid.right[ground] - 1).tolist()))
+        inside = blocking & (grid.top < y) & (grid.bottom > y - physics.HIT_HEIGHT)
+        blocked = union(zip((grid.left[inside] - physics.HIT_WIDTH + 1).tolist(), (grid.right[inside] - 1).tolist()))
+        for left, right in subtract(supports, blocked):
+            left = max(left, 0)
+            right = min(right, width - physics.HIT_WIDTH)
+            if left <= right:
+                surfaces.append((left, right, y))
+    return surfaces
+
+
+class NavGraph:
+    def __init__(self, nodes, edges, spawn=None, exits=()):
+        # nodes are (left, right, y) surfaces, edges are (from, to, move, frames, abilities)
+        self.nodes = [tuple(node) for node in nodes]
+        self.edges = [(start, end, move, frames, tuple(abilities)) for start, end, move, frames, abilities in edges]
+        self.spawn = spawn
+        self.exits = list(exits)
+        self.neighbours = [[] for node in self.nodes]
+        for edge in self.edges:
+            self.neighbours[edge[0]].append(edge)
+        self.rows = {}
+        for index, (left, right, y) in enumerate(self.nodes):
+            self.rows.setdefault(y, []).append(index)
+
+    def node_at(self, x, y):
+        # The surface a hit box with its top left at (x, y) is standing on, or None
+        for index in self.rows.get(y + physics.HIT_HEIGHT, ()):
+            left, right, ground = self.nodes[index]
+            if left <= x <= right:
+                return index
+        return None
+
+    def gap(self, start, end):
+        # straight line distance between the closest points of two surfaces
+        left, right, y = self.nodes[start]
+        other_left, other_right, other_y = self.nodes[end]
+        dx = max(0, other_left - right, left - other_right)
+        return math.hypot(dx, other_y - y)
+
+    def find_path(self, start, goal, abilities=ABILITIES):
+        # A* from one node to another using only edges the abilities allow. Returns the list of edges to take,
+        # [] when already there, or None when goal can't be reached. Costs are frames, and nothing moves
+        # faster than a teleport or the fastest vertical speed, which keeps the estimate a lower bound.
+        speed = max(settings.TELEPORT_MAGNITUDE, settings.MAX_JUMP_VELOCITY, settings.MAX_FALL_VELOCITY,
+                    SPRINT_SPEED)
+        allowed = set(abilities)
+        best = {start: 0}
+        came_from = {}
+        queue = [(self.gap(start, goal) / speed, 0, start)]
+        while queue:
+            estimate, cost, node = heapq.heappop(queue)
+            if node == goal:
+                steps = []
+                while node != start:
+                    edge = came_from[node]
+                    steps.append(edge)
+                    node = edge[0]
+                return steps[::-1]
+            if cost > best[node]:
+                continue
+            for edge in self.neighbours[node]:
+                if not allowed.issuperset(edge[4]):
+                    continue
+                end = edge[1]
+                new_cost = cost + edge[3]
+                if new_cost < best.get(end, math.inf):
+                    best[end] = new_cost
+                    came_from[end] = edge
+                    heapq.heappush(queue, (new_cost + self.gap(end, goal) / speed, new_cost, end))
+        return None
+
+    def reachable(self, start=None, abilities=ABILITIES):
+        # every node that can be got to from start, the spawn by default
+        start = self.spawn if start is None else start
+        if start is None:
+            return set()
+        allowed = set(abilities)
+        found = {start}
+        stack = [start]
+        while stack:
+            for edge in self.neighbours[stack.pop()]:
+                if edge[1] not in found and allowed.issuperset(edge[4]):
+                    found.add(edge[1])
+                    stack.append(edge[1])
+        return found
+
+    def completable(self, abilities=ABILITIES):
+        return any(exit_node in self.reachable(abilities=abilities) for exit_node in self.exits)
+
+    def to_dict(self):
+        return {'nodes': self.nodes, 'edges': self.edges, 'spawn': self.spawn, 'exits': self.exits}
+
+
+def find_edges(grid, nodes):
+    # Tries every move from every surface as one big PlayerBatch and keeps the quickest way found between each
+    # pair of surfaces for each set of abilities. Returns (from, to, move, frames, abilities) edges.
+    graph = NavGraph(nodes, [])
+    programs = []
+    for index, (left, right, y) in enumerate(nodes):
+        # off either end with a standing start, walking or sprinting, and standing jumps along the surface
+        for x, direction in ((right, 1), (left, -1)):
+            for speed in (0.0, WALK_SPEED, SPRINT_SPEED):
+                for move in MOVES:
+                    programs.append((index, x, y, direction, speed, move))
+        for x in sorted(set(list(range(left, right, TAKEOFF_SPACING)) + [right])):
+            for direction in (-1, 0, 1):
+                for move in MOVES:
+                    if move[0] == 'fall' or (move[0] == 'teleport' and direction == 0):
+                        continue
+                    programs.append((index, x, y, direction, 0.0, move))
+    if not programs:
+        return []
+
+    count = len(programs)
+    batch = physics.PlayerBatch(grid, count, (0, 0))
+    start_node = numpy.array([program[0] for program in programs])
+    batch.x[:] = [program[1] for program in programs]
+    batch.y[:] = [program[2] - physics.HIT_HEIGHT for program in programs]
+    batch.position_x[:] = batch.x
+    batch.position_y[:] = batch.y
+    direction = numpy.array([program[3] for program in programs], dtype=numpy.float64)
+    batch.velocity_x[:] = direction * [program[4] for program in programs]
+    batch.can_double_jump[:] = [program[5][1] == 'double_jump' for program in programs]
+    batch.can_teleport[:] = [program[5][1] == 'teleport' for program in programs]
+    # sprinting starts keep the trigger held so the run up doesn't slow down on the takeoff frame
+    sprinting = numpy.array([program[4] > WALK_SPEED for program in programs])
+    batch.can_sprint[:] = sprinting
+    trigger = numpy.where(sprinting, -1.0, 0.0)
+    jumps = numpy.array([program[5][2] is not None for program in programs])
+    release = numpy.array([program[5][2] if program[5][2] is not None else -1 for program in programs])
+    second = numpy.array([program[5][3] if program[5][3] is not None else -1 for program in programs])
+    steer = numpy.array([program[5][4] for program in programs])
+    teleport = numpy.array([program[5][5] if program[5][5] is not None else -1 for program in programs])
+
+    zeros = numpy.zeros(count)
+    done = numpy.zeros(count, dtype=bool)
+    left_ground = numpy.zeros(count, dtype=bool)
+    quickest = {}
+    for frame in range(MAX_FRAMES):
+        horizontal = numpy.where(frame < steer, direction, 0.0)
+        pressed = (jumps & (frame == 0)) | (frame == second)
+        released = frame == release
+        batch.step(horizontal, zeros, trigger, pressed, released, numpy.where(frame == teleport, direction, 0.0))
+
+        ground = batch.contacts()[0]
+        left_ground |= ~ground
+        done |= batch.deaths > 0
+        for agent in numpy.nonzero(ground & ~done)[0].tolist():
+            node = graph.node_at(int(batch.x[agent]), int(batch.y[agent]))
+            if node == start_node[agent] and not left_ground[agent]:
+                continue
+            done[agent] = True
+            if node is None or node == start_node[agent]:
+                continue
+            program = programs[agent]
+            abilities = tuple(ability for ability in ABILITIES
+                              if ability == program[5][1] or (ability == 'sprint' and sprinting[agent]))
+            key = (program[0], node, abilities)
+            if key not in quickest or frame + 1 < quickest[key][1]:
+                quickest[key] = (program[5][0], frame + 1)
+        if done.all():
+            break
+
+    return [(start, end, move, frames, abilities)
+            for (start, end, abilities), (move, frames) in sorted(quickest.items())]
+
+
+def build(filename, cache_folder=CACHE_FOLDER):
+    level = tilemap.Map(filename, cache_folder, image_loader=tilemap.plain_image_loader)
+    specs, spawn, exits = level_objects(level)
+    tiles = None
+    if level.tile_blocks is not None:
+        tiles = collision.TileGrid(level.tile_blocks, level.tilewidth, level.tileheight)
+    grid = collision.StaticGrid(level.width, level.height, collision.merge_blocks(specs), tiles,
+                                cell_size=level.tilewidth)
+
+    nodes = find_surfaces(grid, level.width)
+    graph = NavGraph(nodes, find_edges(grid, nodes))
+
+    if spawn is not None:
+        # wherever the player comes down after appearing at the spawn
+        batch = physics.PlayerBatch(grid, 1, spawn)
+        still = numpy.zeros(1)
+        for frame in range(MAX_FRAMES):
+            batch.step(still, still, still, still, still)
+            if batch.deaths[0]:
+                break
+            if batch.contacts()[0][0]:
+                graph.spawn = graph.node_at(int(batch.x[0]), int(batch.y[0]))
+                break
+
+    for exit_left, exit_top, exit_right, exit_bottom in exits:
+        for index, (left, right, y) in enumerate(nodes):
+            if left < exit_right and exit_left < right + physics.HIT_WIDTH and \
+                    y - physics.HIT_HEIGHT < exit_bottom and exit_top < y and index not in graph.exits:
+                graph.exits.append(index)
+    return graph
+
+
+def parameters():
+    # the settings a graph was built with, a graph built with others is stale
+    return {name: getattr(settings, name) for name in ('PLAYER_ACCELERATION', 'GRAVITY_MAGNITUDE', 'DRAG',
+                                                       'WALL_FRICTION', 'BOUNCE_MAGNITUDE', 'MAX_FALL_VELOCITY',
+                                                       'MAX_JUMP_VELOCITY', 'PLAYER_JUMP', 'PLAYER_HEIGHT',
+                                                       'TELEPORT_MAGNITUDE', 'STARTING_ENERGY')}
+
+
+def graph_path(filename):
+    return path.splitext(filename)[0] + '.nav.json'
+
+
+def save(filename, graph):
+    data = graph.to_dict()
+    data.update({'version': VERSION, 'level': levelcache.level_hash(filename, CACHE_FOLDER),
+                 'parameters': parameters()})
+    with open(graph_path(filename), 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+
+
+def load(filename):
+    # The saved NavGraph for filename, or None when there is none or it's out of date
+    if not path.isfile(graph_path(filename)):
+        return None
+    try:
+        with open(graph_path(filename)) as f:
+            data = json.load(f)
+    except ValueError:
+        return None
+    if data.get('version') != VERSION or data.get('level') != levelcache.level_hash(filename, CACHE_FOLDER) or \
+            data.get('parameters') != parameters():
+        return None
+    return NavGraph(data['nodes'], data['edges'], data['spawn'], data['exits'])
+
+
+def get(filename):
+    graph = load(filename)
+    if graph is None:
+        graph = build(filename)
+        save(filename, graph)
+    return graph
+
+
+def main(args):
+    import glob
+    import itertools
+    if args:
+        map_files = [path.abspath(name) if path.isfile(name) else path.join(GAME_FOLDER, 'maps', name)
+                     for name in args]
+    else:
+        map_files = sorted(glob.glob(path.join(GAME_FOLDER, 'maps', '*.tmx')))
+
+    for map_file in map_files:
+        graph = build(map_file)
+        save(map_file, graph)
+        # the smallest sets of abilities that get from the spawn to an exit
+        needed = []
+        for size in range(len(ABILITIES) + 1):
+            for abilities in itertools.combinations(ABILITIES, size):
+                if graph.completable(abilities) and not any(set(found) <= set(abilities) for found in needed):
+                    needed.append(abilities)
+        if not graph.exits:
+            result = 'no exit'
+        elif graph.spawn is None:
+            result = 'spawn is not over any surface'
+        elif needed:
+            result = 'exit reachable with ' + ' or '.join(' + '.join(abilities) or 'no abilities'
+                                                          for abilities in needed)
+        else:
+            result = 'exit not reachable'
+        print('{:<16}{:>5} surfaces {:>6} edges  {}'.format(path.basename(map_file), len(graph.nodes),
+                                                            len(graph.edges), result))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
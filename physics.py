@@ -0,0 +1,421 @@
+import numpy
+import settings
+import sprites
+import collision
+
+# Batch physics for many simulated players on one level, for AI training and level validation runs.
+# PlayerBatch keeps N players' hit boxes, velocities, energy and movement flags in NumPy arrays and steps
+# them all at once with the same rules as Player: gravity, drag, block friction, jumping, double and wall
+# jumps, sprinting, wall grabbing, teleports and swept collision against the level's blocks. Agents only
+# move, they don't attack or press buttons.
+#     grid = collision.StaticGrid(width, height, block_specs, tile_grid)
+#     batch = PlayerBatch(grid, 256, spawn)
+#     batch.step(horizontal, vertical, trigger, jump_pressed, jump_released)
+# tests/test_physics_parity.py checks the batch against the real Player on the shipped maps.
+HIT_WIDTH = 24
+HIT_HEIGHT = 63
+
+# BlockType values by type id
+FRICTION = numpy.array([block_type.friction for block_type in sprites.BLOCK_TYPES], dtype=numpy.float64)
+BOUNCE = numpy.array([block_type.bounce for block_type in sprites.BLOCK_TYPES], dtype=numpy.float64)
+DEATH = numpy.array([block_type.death for block_type in sprites.BLOCK_TYPES])
+WALL = numpy.array([block_type.wall for block_type in sprites.BLOCK_TYPES])
+PLATFORM = numpy.array([block_type.platform for block_type in sprites.BLOCK_TYPES])
+BOUNCY = numpy.array([block_type.name == 'bounce' for block_type in sprites.BLOCK_TYPES])
+
+UP, DOWN, LEFT, RIGHT = [collision.StaticGrid.DIRECTIONS.index(name) for name in ('up', 'down', 'left', 'right')]
+
+
+def round_rect(values):
+    # What pygame stores when a float is assigned to a Rect attribute: nearest int, halves away from zero
+    whole = numpy.trunc(values)
+    return (whole + numpy.sign(values) * (numpy.abs(values - whole) >= 0.5)).astype(numpy.int64)
+
+
+def overlaps(left, top, right, bottom, other_left, other_top, other_right, other_bottom):
+    # colliderect for arrays of rects given by their edges
+    return (left < other_right) & (other_left < right) & (top < other_bottom) & (other_top < bottom)
+
+
+class PlayerBatch:
+    def __init__(self, grid, count, spawn, ticks=0):
+        self.grid = grid
+        self.count = count
+        self.spawn = spawn
+
+        # the hit box's top left like Player.hit_rect, position is the float copy Player keeps next to it
+        self.x = numpy.full(count, round_rect(numpy.float64(spawn[0])), dtype=numpy.int64)
+        self.y = numpy.full(count, round_rect(numpy.float64(spawn[1])), dtype=numpy.int64)
+        self.position_x = numpy.full(count, spawn[0], dtype=numpy.float64)
+        self.position_y = numpy.full(count, spawn[1], dtype=numpy.float64)
+        self.velocity_x = numpy.zeros(count)
+        self.velocity_y = numpy.zeros(count)
+        self.acceleration_x = numpy.zeros(count)
+        self.acceleration_y = numpy.zeros(count)
+
+        # ability flags
+        self.can_double_jump = numpy.zeros(count, dtype=bool)
+        self.can_wall_grab = numpy.zeros(count, dtype=bool)
+        self.can_sprint = numpy.zeros(count, dtype=bool)
+        self.can_teleport = numpy.zeros(count, dtype=bool)
+
+        # movement flags
+        self.facing_right = numpy.ones(count, dtype=bool)
+        self.walking = numpy.zeros(count, dtype=bool)
+        self.jumping = numpy.zeros(count, dtype=bool)
+        self.double_jumping = numpy.zeros(count, dtype=bool)
+        self.wall_grabbing = numpy.zeros(count, dtype=bool)
+        self.wall_jumping = numpy.zeros(count, dtype=bool)
+        self.sprinting = numpy.zeros(count, dtype=bool)
+
+        self.energy = numpy.full(count, settings.STARTING_ENERGY, dtype=numpy.int64)
+        self.cooling_down = numpy.zeros(count, dtype=bool)
+        self.last = numpy.full(count, ticks, dtype=numpy.int64)
+        # same clock as inputs.InputSystem, every agent shares it
+        self.ticks = ticks
+        self.frame_number = 0
+        self.deaths = numpy.zeros(count, dtype=numpy.int64)
+
+    def step(self, horizontal, vertical, trigger, jump_pressed, jump_released, teleport=None):
+        # One frame for every agent. Arguments are arrays with a value per agent: the LeftHorizontal,
+        # LeftVertical and Trigger axes, whether A was pressed or released, and optionally -1 or 1 for the
+        # left or right bumper being pressed, i.e. what Game.events and Player.update see for a player.
+        self.ticks += (self.frame_number + 1) * 1000 // settings.FPS - self.frame_number * 1000 // settings.FPS
+        self.frame_number += 1
+        self.button_actions(numpy.asarray(vertical), numpy.asarray(jump_pressed, dtype=bool),
+                            numpy.asarray(jump_released, dtype=bool), teleport)
+        self.update(numpy.asarray(horizontal), numpy.asarray(trigger))
+
+    def contacts(self):
+        # ContactSensor for every agent: (ground, platform, left wall, right wall, friction)
+        x, y = self.x, self.y
+        blocks = self.grid.near(x - 1, y - 1, x + HIT_WIDTH + 1, y + HIT_HEIGHT + 1)
+        valid = blocks >= 0
+        blocks = numpy.where(valid, blocks, 0)
+        left = self.grid.left[blocks]
+        top = self.grid.top[blocks]
+        right = self.grid.right[blocks]
+        bottom = self.grid.bottom[blocks]
+        types = self.grid.types[blocks]
+        x, y = x[:, None], y[:, None]
+
+        below = valid & overlaps(x, y + 1, x + HIT_WIDTH, y + 1 + HIT_HEIGHT, left, top, right, bottom)
+        ground = below.any(axis=1)
+        # the last block touched underneath in level order decides friction
+        last = numpy.where(below, blocks, -1).argmax(axis=1)
+        friction = numpy.where(ground, FRICTION[types[numpy.arange(self.count), last]], 0)
+        platform = (below & PLATFORM[types] & (y + 1 + HIT_HEIGHT >= top) & (y + 1 < top)).any(axis=1)
+        wall = valid & WALL[types]
+        left_wall = wall & overlaps(x - 1, y, x - 1 + HIT_WIDTH, y + HIT_HEIGHT, left, top, right, bottom)
+        right_wall = wall & overlaps(x + 1, y, x + 1 + HIT_WIDTH, y + HIT_HEIGHT, left, top, right, bottom)
+        return ground, platform, left_wall.any(axis=1), right_wall.any(axis=1), friction
+
+    def button_actions(self, vertical, pressed, released, teleport=None):
+        ground, platform, left_wall, right_wall, friction = self.contacts()
+        airborne = ~ground
+
+        drop = pressed & (vertical > 0.85)
+        pressed = pressed & ~drop
+        wall_jump = pressed & self.wall_grabbing & airborne & (self.energy > 0)
+        pressed &= ~wall_jump
+        jump = pressed & ground
+        double_jump = pressed & airborne & self.can_double_jump & ~self.double_jumping
+
+        # platform drop
+        drop &= platform
+        if drop.any():
+            self.platform_drop(numpy.nonzero(drop)[0])
+        self.velocity_y[drop] = settings.PLAYER_JUMP / 2.5
+
+        self.wall_jumping |= wall_jump
+        self.wall_grabbing &= ~wall_jump
+        self.velocity_x[wall_jump] = numpy.where(self.facing_right[wall_jump], -1 * settings.PLAYER_JUMP,
+                                                 settings.PLAYER_JUMP)
+        self.velocity_y[wall_jump] = -2 * settings.PLAYER_JUMP - settings.GRAVITY_MAGNITUDE
+
+        self.velocity_y[jump] = -settings.PLAYER_JUMP
+        self.jumping |= jump
+
+        self.double_jumping |= double_jump
+        self.velocity_y[double_jump] = -settings.PLAYER_JUMP
+
+        # joystick_teleport
+        teleported = numpy.zeros(self.count, dtype=bool)
+        if teleport is not None:
+            teleport = numpy.asarray(teleport)
+            teleported = self.can_teleport & (teleport != 0) & (self.energy >= settings.STARTING_ENERGY / 2)
+            self.energy[teleported] = 0
+            self.move(teleported, numpy.where(teleported, teleport * settings.TELEPORT_MAGNITUDE, 0.0),
+                      numpy.zeros(self.count))
+
+        # jump cut
+        if drop.any() or teleported.any():
+            airborne = ~self.contacts()[0]
+        self.velocity_y[released & airborne & (self.velocity_y < 0)] = 0
+
+    def platform_drop(self, agents):
+        # Player.platform_drop for some agents: down through platforms, stopping on top of anything else
+        distance = settings.PLAYER_HEIGHT
+        x = self.x[agents]
+        y = self.y[agents]
+        blocks = self.grid.near(x, y, x + HIT_WIDTH, y + distance + HIT_HEIGHT)
+        valid = blocks >= 0
+        blocks = numpy.where(valid, blocks, 0)
+        left = self.grid.left[blocks]
+        top = self.grid.top[blocks]
+        right = self.grid.right[blocks]
+        bottom = self.grid.bottom[blocks]
+        x, y = x[:, None], y[:, None]
+
+        # collision.time_of_impact straight down
+        inside = overlaps(x, y, x + HIT_WIDTH, y + HIT_HEIGHT, left, top, right, bottom)
+        t = (top - (y + HIT_HEIGHT)) / distance
+        ahead = valid & ~PLATFORM[self.grid.types[blocks]] & ~inside & (x < right) & (left < x + HIT_WIDTH) & \
+            (t >= 0) & (t < 1)
+        step = numpy.where(ahead, numpy.trunc(distance * t), distance).min(axis=1)
+        self.y[agents] += step.astype(numpy.int64)
+
+    def regain_energy(self):
+        start = (self.energy <= 0) & ~self.cooling_down
+        self.cooling_down |= start
+        self.last[start] = self.ticks
+
+        done = self.cooling_down & (self.ticks - self.last >= settings.ENERGY_COOLDOWN)
+        self.last[done] = self.ticks
+        self.cooling_down &= ~done
+
+        regen = ~self.cooling_down
+        self.energy[regen] = numpy.minimum(self.energy[regen] + settings.ENERGY_REGEN, settings.STARTING_ENERGY)
+
+    def update(self, horizontal, trigger):
+        # Player.update for every agent, the same steps in the same order
+        self.regain_energy()
+        ground, platform, left_wall, right_wall, friction = self.contacts()
+        airborne = ~ground
+
+        # begin_frame
+        still = ((-0.85 < horizontal) & (horizontal < 0.85)) | airborne
+        self.walking &= ~still
+        self.wall_grabbing &= ~still
+        self.sprinting &= ~(((-0.85 < trigger) & (trigger <= 0)) | (self.energy < 2))
+        self.acceleration_x = numpy.zeros(self.count)
+        self.acceleration_y = numpy.where(airborne, float(settings.GRAVITY_MAGNITUDE), 0.0)
+
+        # joystick_movement, only 20% of the acceleration in the air
+        acceleration = numpy.where(airborne, 0.2 * settings.PLAYER_ACCELERATION, settings.PLAYER_ACCELERATION)
+        left = horizontal < -0.85
+        right = horizontal > 0.85
+        self.acceleration_x[left] = -acceleration[left]
+        self.acceleration_x[right] = acceleration[right]
+        self.facing_right[left] = False
+        self.facing_right[right] = True
+        self.walking |= (left | right) & ground
+
+        # joystick_sprint
+        sprint = self.can_sprint & ground & (self.energy >= 5) & (trigger < -0.85) & (left | right)
+        self.energy[sprint] = numpy.maximum(self.energy[sprint] - 5, 0)
+        self.acceleration_x[sprint] *= 3
+        self.sprinting |= sprint
+
+        # apply_resistance
+        self.acceleration_x = numpy.where(airborne, self.acceleration_x * settings.DRAG,
+                                          self.acceleration_x + self.velocity_x * friction)
+        self.acceleration_y = numpy.where(airborne, self.acceleration_y * settings.DRAG, self.acceleration_y)
+
+        # calculate_velocity
+        self.velocity_x += self.acceleration_x
+        self.velocity_y += self.acceleration_y
+        self.velocity_x[numpy.abs(self.velocity_x) < 0.1] = 0
+        self.velocity_y[self.velocity_y > settings.MAX_FALL_VELOCITY] = settings.MAX_FALL_VELOCITY
+        self.velocity_y[self.velocity_y < -settings.MAX_JUMP_VELOCITY] = -settings.MAX_JUMP_VELOCITY
+
+        dx = (self.position_x + self.velocity_x + 0.5 * self.acceleration_x) - self.position_x
+        dy = (self.position_y + self.velocity_y + 0.5 * self.acceleration_y) - self.position_y
+
+        # joystick_wall_grab
+        grabbing = airborne & self.can_wall_grab
+        self.wall_grabbing[grabbing] = ((left_wall | right_wall) & (trigger > 0.85))[grabbing]
+        grab = grabbing & self.wall_grabbing & (self.energy >= 5)
+        self.acceleration_x[grab] = 0
+        self.acceleration_y[grab] = 0
+        self.velocity_x[grab] = 0
+        self.velocity_y[grab] = 0
+        self.energy[grab] -= 5
+        self.move(grab, numpy.zeros(self.count), numpy.zeros(self.count))
+        self.double_jumping &= ~grab
+
+        # a wall jump overrides the grab
+        self.move(~grab | self.wall_jumping, dx, dy)
+
+    def move(self, moving, dx, dy):
+        # Player.move for the agents in the moving mask
+        self.depenetrate(numpy.nonzero(moving)[0])
+        dx = round_rect(self.x + dx) - self.x
+        dy = round_rect(self.y + dy) - self.y
+        dead = numpy.zeros(self.count, dtype=bool)
+
+        active = moving & ((dx != 0) | (dy != 0))
+        while active.any():
+            agents = numpy.nonzero(active)[0]
+            t, axis, block = self.first_contact(agents, dx[agents], dy[agents])
+
+            free = block < 0
+            self.x[agents[free]] += dx[agents[free]]
+            self.y[agents[free]] += dy[agents[free]]
+            dx[agents[free]] = 0
+            dy[agents[free]] = 0
+
+            # back to the spawn, which also puts position there
+            death = ~free & DEATH[self.grid.types[block]]
+            dead[agents[death]] = True
+            self.x[agents[death]] = round_rect(numpy.float64(self.spawn[0]))
+            self.y[agents[death]] = round_rect(numpy.float64(self.spawn[1]))
+            self.deaths[agents[death]] += 1
+            dx[agents[death]] = 0
+            dy[agents[death]] = 0
+
+            hit = ~free & ~death
+            side = hit & (axis == 0)
+            if side.any():
+                who = agents[side]
+                step = numpy.trunc(dy[who] * t[side]).astype(numpy.int64)
+                self.y[who] += step
+                dy[who] -= step
+                self.block_collide(who, block[side], dx[who], numpy.zeros(len(who), dtype=numpy.int64))
+                dx[who] = 0
+            flat = hit & (axis == 1)
+            if flat.any():
+                who = agents[flat]
+                step = numpy.trunc(dx[who] * t[flat]).astype(numpy.int64)
+                self.x[who] += step
+                dx[who] -= step
+                self.block_collide(who, block[flat], numpy.zeros(len(who), dtype=numpy.int64), dy[who])
+                dy[who] = 0
+
+            active = moving & ((dx != 0) | (dy != 0))
+
+        self.position_x[moving] = numpy.where(dead, self.spawn[0], self.x)[moving]
+        self.position_y[moving] = numpy.where(dead, self.spawn[1], self.y)[moving]
+
+    def depenetrate(self, agents):
+        # Player.depenetrate for some agents: out of the first wall or bounce block in level order each pass,
+        # the shortest way, like collision.push_out
+        for i in range(settings.DEPENETRATION_PASSES):
+            if not len(agents):
+                return
+            x = self.x[agents]
+            y = self.y[agents]
+            blocks = self.grid.near(x, y, x + HIT_WIDTH, y + HIT_HEIGHT)
+            valid = blocks >= 0
+            blocks = numpy.where(valid, blocks, 0)
+            types = self.grid.types[blocks]
+            inside = valid & (WALL[types] | BOUNCY[types]) & \
+                overlaps(x[:, None], y[:, None], x[:, None] + HIT_WIDTH, y[:, None] + HIT_HEIGHT,
+                         self.grid.left[blocks], self.grid.top[blocks], self.grid.right[blocks],
+                         self.grid.bottom[blocks])
+            stuck = inside.any(axis=1)
+            block = blocks[numpy.arange(len(agents)), numpy.where(inside, blocks, len(self.grid.types)).argmin(axis=1)]
+            block, agents, x, y = block[stuck], agents[stuck], x[stuck], y[stuck]
+
+            up = y + HIT_HEIGHT - self.grid.top[block]
+            down = self.grid.bottom[block] - y
+            left = x + HIT_WIDTH - self.grid.left[block]
+            right = self.grid.right[block] - x
+            shortest = numpy.minimum(numpy.minimum(up, down), numpy.minimum(left, right))
+            vertical = (shortest == up) | (shortest == down)
+            self.y[agents] += numpy.where(shortest == up, -up, numpy.where(shortest == down, down, 0))
+            self.x[agents] += numpy.where(vertical, 0, numpy.where(shortest == left, -left, right))
+
+    def first_contact(self, agents, dx, dy):
+        # Player.first_contact for some agents: (t, axis, block) arrays, block -1 where nothing gets hit.
+        # Of two blocks hit at the same moment the earlier one in the level wins.
+        x = self.x[agents]
+        y = self.y[agents]
+        move_x = x + dx
+        move_y = y + dy
+        blocks = self.grid.near(numpy.minimum(x, move_x), numpy.minimum(y, move_y),
+                                numpy.maximum(x, move_x) + HIT_WIDTH, numpy.maximum(y, move_y) + HIT_HEIGHT)
+        valid = blocks >= 0
+        blocks = numpy.where(valid, blocks, 0)
+        left = self.grid.left[blocks]
+        top = self.grid.top[blocks]
+        right = self.grid.right[blocks]
+        bottom = self.grid.bottom[blocks]
+        types = self.grid.types[blocks]
+
+        x, y, dx, dy = x[:, None], y[:, None], dx[:, None], dy[:, None]
+        inside = overlaps(x, y, x + HIT_WIDTH, y + HIT_HEIGHT, left, top, right, bottom)
+        # collision.time_of_impact for every candidate
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            x_entry = numpy.where(dx > 0, (left - (x + HIT_WIDTH)) / dx, (right - x) / dx)
+            x_exit = numpy.where(dx > 0, (right - x) / dx, (left - (x + HIT_WIDTH)) / dx)
+            y_entry = numpy.where(dy > 0, (top - (y + HIT_HEIGHT)) / dy, (bottom - y) / dy)
+            y_exit = numpy.where(dy > 0, (bottom - y) / dy, (top - (y + HIT_HEIGHT)) / dy)
+        still_x = (dx == 0) & (x < right) & (left < x + HIT_WIDTH)
+        still_y = (dy == 0) & (y < bottom) & (top < y + HIT_HEIGHT)
+        x_entry = numpy.where(still_x, -numpy.inf, x_entry)
+        x_exit = numpy.where(still_x, numpy.inf, x_exit)
+        y_entry = numpy.where(still_y, -numpy.inf, y_entry)
+        y_exit = numpy.where(still_y, numpy.inf, y_exit)
+        crossing = ((dx != 0) | still_x) & ((dy != 0) | still_y)
+
+        entry = numpy.maximum(x_entry, y_entry)
+        axis = numpy.where(x_entry > y_entry, 0, 1)
+        reached = crossing & (entry >= 0) & (entry < 1) & (entry < numpy.minimum(x_exit, y_exit))
+        # platforms can only be landed on
+        reached &= ~PLATFORM[types] | ((axis == 1) & (dy > 0))
+        # already inside at the start: death blocks still kill, and platforms catch you falling from inside
+        caught = inside & (DEATH[types] | (PLATFORM[types] & (dy > 0)))
+        t = numpy.where(inside, numpy.where(caught, 0.0, numpy.inf), numpy.where(reached, entry, numpy.inf))
+        t[~valid] = numpy.inf
+        axis = numpy.where(inside, 1, axis)
+
+        first = t.min(axis=1)
+        earliest = numpy.where(t == first[:, None], blocks, len(self.grid.types)).argmin(axis=1)
+        rows = numpy.arange(len(agents))
+        block = numpy.where(numpy.isfinite(first), blocks[rows, earliest], -1)
+        return first, axis[rows, earliest], block
+
+    def landing_reset(self, agents):
+        self.velocity_y[agents] = 0
+        self.jumping[agents] = False
+        self.double_jumping[agents] = False
+        self.wall_grabbing[agents] = False
+        self.wall_jumping[agents] = False
+
+    def block_collide(self, agents, blocks, dx, dy):
+        # Player.block_collide for agents that each hit one block moving along one axis
+        grid = self.grid
+        types = grid.types[blocks]
+        wall = WALL[types]
+        platform = PLATFORM[types]
+        bouncy = BOUNCY[types]
+        direction = grid.directions[blocks]
+        bounce = BOUNCE[types]
+        solid = wall | bouncy
+
+        # the face that got hit, for walls and bounce blocks alike
+        right = solid & (dx > 0)
+        self.x[agents[right]] = grid.left[blocks[right]] - HIT_WIDTH
+        left = solid & (dx < 0)
+        self.x[agents[left]] = grid.right[blocks[left]]
+        down = (solid | platform) & (dy > 0)
+        self.y[agents[down]] = grid.top[blocks[down]] - HIT_HEIGHT
+        up = solid & (dy < 0)
+        self.y[agents[up]] = grid.bottom[blocks[up]]
+
+        self.velocity_x[agents[wall & (dx != 0)]] = 0
+        self.velocity_y[agents[wall & up]] = 0
+        self.landing_reset(agents[down & ~(bouncy & (direction == UP))])
+
+        launch = bouncy & down & (direction == UP)
+        self.jumping[agents[launch]] = True
+        self.double_jumping[agents[launch]] = False
+        self.wall_jumping[agents[launch]] = False
+        self.velocity_y[agents[launch]] = -self.velocity_y[agents[launch]] - bounce[launch]
+        launch = bouncy & up & (direction == DOWN)
+        self.velocity_y[agents[launch]] = -self.velocity_y[agents[launch]] + bounce[launch]
+        launch = bouncy & right & (direction == LEFT)
+        self.velocity_x[agents[launch]] = -self.velocity_x[agents[launch]] - bounce[launch]
+        launch = bouncy & left & (direction == RIGHT)
+        self.velocity_x[agents[launch]] = -self.velocity_x[agents[launch]] + bounce[launch]
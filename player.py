@@ -1,18 +1,8 @@
 import pygame
 import settings
 import sprites
-
-
-# this should probably be moved out of this file
-class Spritesheet:
-    def __init__(self, filename):
-        self.spritesheet = pygame.image.load(filename).convert_alpha()
-
-    def get_image(self, x, y, width, height):
-        image = pygame.Surface((width, height))
-        image.blit(self.spritesheet, (0, 0), (x, y, width, height))
-        image = pygame.transform.scale(image, (width // 4, height // 4))
-        return image
+import collision
+import atlas
 
 
 class Player(pygame.sprite.Sprite):
@@ -32,6 +22,7 @@ class Player(pygame.sprite.Sprite):
         self.hit_rect = pygame.Rect(0, 0, 24, 63)
         self.hit_image.fill(settings.WHITE, self.hit_rect)
         self.hit_image.set_alpha(100)
+        self.contacts = collision.ContactSensor(game, self.hit_rect)
 
         # animation stuff
         self.current_frame = 0
@@ -63,95 +54,34 @@ class Player(pygame.sprite.Sprite):
         self.energy_regen = settings.ENERGY_REGEN
         self.energy_cooldown = settings.ENERGY_COOLDOWN
         self.cooling_down = False
-        self.last = pygame.time.get_ticks()
+        self.last = self.game.get_ticks()
 
     def load_images(self):
-        self.standing_frames_right = []
-        for i in range(8):
-            self.standing_frames_right.append(self.game.idle_spritesheet.get_image(197 * i, 0, 197, 257))
-        self.standing_frames_left = []
-        for frame in self.standing_frames_right:
-            frame.set_colorkey(settings.BLACK)
-            self.standing_frames_left.append(pygame.transform.flip(frame, True, False))
-
-        self.walking_frames_right = []
-        for i in range(8):
-            self.walking_frames_right.append(self.game.walk_spritesheet.get_image(240 * i, 0, 240, 258))
-        self.walking_frames_left = []
-        for frame in self.walking_frames_right:
-            frame.set_colorkey(settings.BLACK)
-            self.walking_frames_left.append(pygame.transform.flip(frame, True, False))
-
-        self.running_frames_right = []
-        for i in range(8):
-            self.running_frames_right.append(self.game.run_spritesheet.get_image(313 * i, 0, 313, 260))
-        self.running_frames_left = []
-        for frame in self.running_frames_right:
-            frame.set_colorkey(settings.BLACK)
-            self.running_frames_left.append(pygame.transform.flip(frame, True, False))
-
-        self.jumping_frames_right = []
-        for i in range(8):
-            self.jumping_frames_right.append(self.game.jump_spritesheet.get_image(223 * i, 0, 223, 342))
-        self.jumping_frames_left = []
-        for frame in self.jumping_frames_right:
-            frame.set_colorkey(settings.BLACK)
-            self.jumping_frames_left.append(pygame.transform.flip(frame, True, False))
-
-        self.double_jumping_frames_right = []
-        for i in range(8):
-            self.double_jumping_frames_right.append(self.game.double_jump_spritesheet.get_image(286 * i, 0, 286, 287))
-        self.double_jumping_frames_left = []
-        for frame in self.double_jumping_frames_right:
-            frame.set_colorkey(settings.BLACK)
-            self.double_jumping_frames_left.append(pygame.transform.flip(frame, True, False))
-
-        self.wall_slide_frames_right = []
-        for i in range(4):
-            self.wall_slide_frames_right.append(self.game.wall_slide_spritesheet.get_image(206 * i, 0, 206, 300))
-        self.wall_slide_frames_left = []
-        for frame in self.wall_slide_frames_right:
-            frame.set_colorkey(settings.BLACK)
-            self.wall_slide_frames_left.append(pygame.transform.flip(frame, True, False))
-
-        self.sword_attack_frames_right = []
-        for i in range(8):
-            self.sword_attack_frames_right.append(self.game.sword_attack_spritesheet.get_image(512 * i, 0, 512, 405))
-        self.sword_attack_frames_left = []
-        for frame in self.sword_attack_frames_right:
-            frame.set_colorkey(settings.BLACK)
-            self.sword_attack_frames_left.append(pygame.transform.flip(frame, True, False))
-
-        self.thrust_attack_frames_right = []
-        for i in range(8):
-            self.thrust_attack_frames_right.append(self.game.sword_thrust_spritesheet.get_image(358 * i, 0, 358, 265))
-        self.thrust_attack_frames_left = []
-        for frame in self.thrust_attack_frames_right:
-            frame.set_colorkey(settings.BLACK)
-            self.thrust_attack_frames_left.append(pygame.transform.flip(frame, True, False))
-
-        self.ranged_attack_frames_right = []
-        for i in range(8):
-            self.ranged_attack_frames_right.append(self.game.ranged_attack_spritesheet.get_image(279 * i, 0, 279, 276))
-        self.ranged_attack_frames_left = []
-        for frame in self.ranged_attack_frames_right:
-            frame.set_colorkey(settings.BLACK)
-            self.ranged_attack_frames_left.append(pygame.transform.flip(frame, True, False))
-
-        self.bullet_frames = []
-        for i in range(8):
-            self.bullet_frames.append(self.game.red_bullet_spritesheet.get_image(60 * i, 0, 60, 61))
-        # for frame in self.bullet_frames:
-        #     frame.set_colorkey(settings.BLACK)
-
-        self.teleporting_frames = []
-        for i in range(8):
-            self.teleporting_frames.append(self.game.teleport_spritesheet.get_image(185 * i, 0, 185, 198))
-        for frame in self.teleporting_frames:
-            frame.set_colorkey(settings.BLACK)
+        # frames are shared between every player through the registry in atlas.py
+        frames = atlas.frames
+        self.standing_frames_right = frames.get_animation('standing', 'right')
+        self.standing_frames_left = frames.get_animation('standing', 'left')
+        self.walking_frames_right = frames.get_animation('walking', 'right')
+        self.walking_frames_left = frames.get_animation('walking', 'left')
+        self.running_frames_right = frames.get_animation('running', 'right')
+        self.running_frames_left = frames.get_animation('running', 'left')
+        self.jumping_frames_right = frames.get_animation('jumping', 'right')
+        self.jumping_frames_left = frames.get_animation('jumping', 'left')
+        self.double_jumping_frames_right = frames.get_animation('double_jumping', 'right')
+        self.double_jumping_frames_left = frames.get_animation('double_jumping', 'left')
+        self.wall_slide_frames_right = frames.get_animation('wall_slide', 'right')
+        self.wall_slide_frames_left = frames.get_animation('wall_slide', 'left')
+        self.sword_attack_frames_right = frames.get_animation('sword_attack', 'right')
+        self.sword_attack_frames_left = frames.get_animation('sword_attack', 'left')
+        self.thrust_attack_frames_right = frames.get_animation('thrust_attack', 'right')
+        self.thrust_attack_frames_left = frames.get_animation('thrust_attack', 'left')
+        self.ranged_attack_frames_right = frames.get_animation('ranged_attack', 'right')
+        self.ranged_attack_frames_left = frames.get_animation('ranged_attack', 'left')
+        self.bullet_frames = frames.get_animation('bullet')
+        self.teleporting_frames = frames.get_animation('teleporting')
 
     def animate(self):
-        now = pygame.time.get_ticks()
+        now = self.game.get_ticks()
 
         if self.sword_attacking:
             if now - self.last_update > 50:
@@ -298,32 +228,87 @@ class Player(pygame.sprite.Sprite):
             self.rect.x = self.hit_rect.x - 40
 
     def move(self, dx, dy):
-        # Move each axis separately. Note that this checks for collisions both times.
-        if dx != 0:
-            self.move_single_axis(dx, 0)
-        if dy != 0:
-            self.move_single_axis(0, dy)
-
-    def move_single_axis(self, dx, dy):
-        # Move the rect
-        self.hit_rect.x += dx
-        self.hit_rect.y += dy
-
-        # Collisions are different for different kinds of blocks
-        for block in self.game.blocks:
-            if self.hit_rect.colliderect(block.rect):
-                if block.death is True:
-                    self.game.restart_level()
-                if block.name == 'wall' or block.name == 'ice':
-                    self.wall_collide(block, dx, dy)
-                elif block.name == 'platform':
-                    self.platform_collide(block, dy)
-                elif block.name == 'bounce':
-                    self.bounce_collide(block, dx, dy)
+        # Swept movement: the hit box travels the straight line to where it's going and stops at the first
+        # block it would run into on the way. That block reacts for the face that got hit, then the box
+        # slides on with whatever is left of the other axis. However far one step goes, nothing gets skipped.
+        self.depenetrate()
+        target = self.hit_rect.copy()
+        target.x += dx
+        target.y += dy
+        dx = target.x - self.hit_rect.x
+        dy = target.y - self.hit_rect.y
+
+        while dx or dy:
+            contact = self.first_contact(dx, dy)
+            if contact is None:
+                self.hit_rect.move_ip(dx, dy)
+                break
+            t, axis, block = contact
+            if block.death is True:
+                # back to the spawn, which also puts position there
+                self.game.restart_level()
+                return
+            if axis == 0:
+                self.hit_rect.y += int(dy * t)
+                dy -= int(dy * t)
+                self.block_collide(block, dx, 0)
+                dx = 0
+            else:
+                self.hit_rect.x += int(dx * t)
+                dx -= int(dx * t)
+                self.block_collide(block, 0, dy)
+                dy = 0
 
         self.position.x = self.hit_rect.x
         self.position.y = self.hit_rect.y
 
+    def depenetrate(self):
+        # The sweep can't stop at a block the hit box is already inside, so a box that starts the move stuck in
+        # a wall or bounce block (a spawn in the ground, a restart) gets pushed out first, the shortest way out
+        # of the first such block in level order, one block per pass
+        for i in range(settings.DEPENETRATION_PASSES):
+            rect = self.hit_rect
+            for block in collision.blocks_near(self.game, rect):
+                if (block.block_type.wall or block.name == 'bounce') and rect.colliderect(block.rect):
+                    break
+            else:
+                return
+            rect.move_ip(*collision.push_out(rect, block.rect))
+
+    def first_contact(self, dx, dy):
+        # The first block the hit box runs into moving by (dx, dy), as (t, axis, block), or None.
+        # See collision.time_of_impact for t and axis. Blocks come back in level order, so of two hit at the
+        # same moment the earlier one in the level wins.
+        rect = self.hit_rect
+        first = None
+        for block in collision.blocks_near(self.game, rect.union(rect.move(dx, dy))):
+            if rect.colliderect(block.rect):
+                # Already inside at the start. Death blocks still kill, and platforms catch you falling
+                # from inside them, so jumping up through one lands you on top.
+                if block.death is True or (block.block_type.platform and dy > 0):
+                    hit = (0.0, 1)
+                else:
+                    continue
+            else:
+                hit = collision.time_of_impact(rect, dx, dy, block.rect)
+                if hit is None:
+                    continue
+                # platforms can only be landed on
+                if block.block_type.platform and (hit[1] != 1 or dy <= 0):
+                    continue
+            if first is None or hit[0] < first[0]:
+                first = (hit[0], hit[1], block)
+        return first
+
+    def block_collide(self, block, dx, dy):
+        # Collisions are different for different kinds of blocks
+        if block.block_type.wall:
+            self.wall_collide(block, dx, dy)
+        elif block.block_type.platform:
+            self.platform_collide(block, dy)
+        elif block.name == 'bounce':
+            self.bounce_collide(block, dx, dy)
+
     def landing_reset(self):
         if self.facing_right:
             self.image = self.standing_frames_right[0]
@@ -413,68 +398,39 @@ class Player(pygame.sprite.Sprite):
 
     def platform_drop(self):
         if self.check_platform():
-            self.hit_rect.y += settings.PLAYER_HEIGHT
+            # Swept like move, so the drop goes through platforms but stops on top of anything else in the way
+            # instead of ending up inside it
+            drop = settings.PLAYER_HEIGHT
+            rect = self.hit_rect
+            for block in collision.blocks_near(self.game, rect.union(rect.move(0, drop))):
+                if block.block_type.platform or rect.colliderect(block.rect):
+                    continue
+                hit = collision.time_of_impact(rect, 0, settings.PLAYER_HEIGHT, block.rect)
+                if hit is not None:
+                    drop = min(drop, int(settings.PLAYER_HEIGHT * hit[0]))
+            self.hit_rect.y += drop
             self.velocity.y = settings.PLAYER_JUMP / 2.5
 
     def check_platform(self):
-        hits = False
-        self.hit_rect.y += 1
-        for platform in self.game.platforms:
-            if self.hit_rect.bottom >= platform.rect.top and self.hit_rect.top < platform.rect.top:
-                if self.hit_rect.colliderect(platform):
-                    hits = True
-        self.hit_rect.y -= 1
-
-        if hits:
-            return True
-        else:
-            return False
+        self.contacts.refresh()
+        return self.contacts.platform
 
     def check_airborne(self):
-        self.hit_rect.y += 1
-        hits = False
-        for block in self.game.blocks:
-            if self.hit_rect.colliderect(block):
-                hits = True
-        self.hit_rect.y -= 1
-        if hits:
-            return False
-        else:
-            return True
+        self.contacts.refresh()
+        return not self.contacts.ground
 
     def get_block_friction(self):
-        self.hit_rect.y += 1
-        hits = False
-        for block in self.game.blocks:
-            if self.hit_rect.colliderect(block):
-                hits = True
-                friction = block.friction
-        self.hit_rect.y -= 1
-        if hits:
-            return friction
-        else:
-            return 0
+        self.contacts.refresh()
+        return self.contacts.friction
 
     def check_wall(self, direction):
-
+        self.contacts.refresh()
         if direction == 'left':
-            check = -1
+            return self.contacts.left_wall
         elif direction == 'right':
-            check = 1
-        else:
-            check = 0
-
-        self.hit_rect.x += check
-        hits = False
-        for wall in self.game.walls:
-            if self.hit_rect.colliderect(wall):
-                hits = True
-        self.hit_rect.x -= check
-
-        if hits:
-            return True
-        else:
-            return False
+            return self.contacts.right_wall
+        # any other direction checks where the player is right now
+        return self.contacts.inside_wall
 
     def update(self):
         self.regain_energy()
@@ -511,11 +467,11 @@ class Player(pygame.sprite.Sprite):
             self.move(dx, dy)
 
     def begin_frame(self):
-        if -0.85 < self.game.joystick.get_axis(settings.JOYAXIS['LeftHorizontal']) < 0.85 or self.check_airborne():
+        if -0.85 < self.game.controls.get_axis(settings.JOYAXIS['LeftHorizontal']) < 0.85 or self.check_airborne():
             self.walking = False
             self.wall_grabbing = False
 
-        if -0.85 < self.game.joystick.get_axis(settings.JOYAXIS['Trigger']) <= 0  or self.current_energy < 2:
+        if -0.85 < self.game.controls.get_axis(settings.JOYAXIS['Trigger']) <= 0  or self.current_energy < 2:
             self.sprinting = False
 
         if self.check_airborne():
@@ -527,9 +483,9 @@ class Player(pygame.sprite.Sprite):
         # Regain the standard amount of energy per frame if not on cooldown, set initial accelerations for new frame
         if self.current_energy <= 0 and not self.cooling_down:
             self.cooling_down = True
-            self.last = pygame.time.get_ticks()
+            self.last = self.game.get_ticks()
 
-        now = pygame.time.get_ticks()
+        now = self.game.get_ticks()
         if self.cooling_down and now - self.last >= self.energy_cooldown:
             self.last = now
             self.cooling_down = False
@@ -548,12 +504,12 @@ class Player(pygame.sprite.Sprite):
             acceleration = settings.PLAYER_ACCELERATION
             airborne = False
 
-        if self.game.joystick.get_axis(settings.JOYAXIS['LeftHorizontal']) < -0.85:
+        if self.game.controls.get_axis(settings.JOYAXIS['LeftHorizontal']) < -0.85:
             self.acceleration.x = - acceleration
             self.facing_right = False
             if not airborne:
                 self.walking = True
-        if self.game.joystick.get_axis(settings.JOYAXIS['LeftHorizontal']) > 0.85:
+        if self.game.controls.get_axis(settings.JOYAXIS['LeftHorizontal']) > 0.85:
             self.acceleration.x = acceleration
             self.facing_right = True
             if not airborne:
@@ -561,9 +517,9 @@ class Player(pygame.sprite.Sprite):
 
     def joystick_sprint(self):
         if self.current_energy >= 5:
-            if self.game.joystick.get_axis(settings.JOYAXIS['Trigger']) < -0.85 and \
-                    (self.game.joystick.get_axis(settings.JOYAXIS['LeftHorizontal']) > 0.85 or \
-                     self.game.joystick.get_axis(settings.JOYAXIS['LeftHorizontal']) < -0.85):
+            if self.game.controls.get_axis(settings.JOYAXIS['Trigger']) < -0.85 and \
+                    (self.game.controls.get_axis(settings.JOYAXIS['LeftHorizontal']) > 0.85 or \
+                     self.game.controls.get_axis(settings.JOYAXIS['LeftHorizontal']) < -0.85):
                 self.current_energy -= 5
                 if self.current_energy <= 0:
                     self.current_energy = 0
@@ -573,9 +529,9 @@ class Player(pygame.sprite.Sprite):
         return False
 
     def joystick_wall_grab(self):
-        if self.check_wall('left') and self.game.joystick.get_axis(settings.JOYAXIS['Trigger']) > 0.85:
+        if self.check_wall('left') and self.game.controls.get_axis(settings.JOYAXIS['Trigger']) > 0.85:
             self.wall_grabbing = True
-        elif self.check_wall('right') and self.game.joystick.get_axis(settings.JOYAXIS['Trigger']) > 0.85:
+        elif self.check_wall('right') and self.game.controls.get_axis(settings.JOYAXIS['Trigger']) > 0.85:
             self.wall_grabbing = True
         else:
             self.wall_grabbing = False
@@ -600,7 +556,7 @@ class Player(pygame.sprite.Sprite):
         if self.current_energy >= self.max_energy / 2:
             self.current_energy = 0
             self.teleporting = True
-            teleport_animation = sprites.SingleAnimation(self.rect.center, self.teleporting_frames, 10)
+            teleport_animation = sprites.SingleAnimation(self.game, self.rect.center, 'teleporting', 10)
             self.game.all_sprites.add(teleport_animation)
             self.move(teleport, 0)
 
@@ -622,9 +578,7 @@ class Player(pygame.sprite.Sprite):
                 direction = 'right'
             else:
                 direction= 'left'
-            bullet = sprites.Bullet(self.game, self.hit_rect.center, direction)
-            self.game.all_sprites.add(bullet)
-            self.game.bullets.add(bullet)
+            self.game.bullets.spawn(self.hit_rect.center, direction)
 
     def apply_resistance(self):
         # Apply resistance depending on block friction or air drag
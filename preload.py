@@ -0,0 +1,78 @@
+import queue
+import threading
+import levelcache
+import tilemap
+
+
+class LevelLoader:
+    # Gets levels ready on a worker thread before the game needs them. The worker parses the tmx and bakes it
+    # into the level cache if there isn't an up to date bake yet, then hands the opened BakedLevel back
+    # through a queue. Everything the game keeps (tile chunks, converted images) is still made on the main
+    # thread, the worker only loads tileset images as they are to render the bake from.
+    def __init__(self):
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = set()
+        self.ready = {}
+        self.thread = threading.Thread(target=self.work, name='level loader', daemon=True)
+        self.thread.start()
+
+    def prefetch(self, filename, cache_folder):
+        if filename in self.pending or filename in self.ready:
+            return
+        self.pending.add(filename)
+        self.requests.put((filename, cache_folder))
+
+    def work(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            filename, cache_folder = request
+            try:
+                baked = levelcache.load(cache_folder, filename)
+                if baked is None:
+                    baked = tilemap.Map(filename, cache_folder, image_loader=tilemap.plain_image_loader).baked
+                self.results.put((filename, baked))
+            except Exception:
+                # the main thread loads it again by itself and gets to see the error then
+                self.results.put((filename, None))
+
+    def collect(self, timeout=0):
+        # Move whatever the worker has finished into ready, waiting up to timeout seconds for the first one
+        try:
+            result = self.results.get(timeout=timeout) if timeout else self.results.get_nowait()
+            while True:
+                filename, baked = result
+                self.pending.discard(filename)
+                if baked is not None:
+                    self.ready[filename] = baked
+                result = self.results.get_nowait()
+        except queue.Empty:
+            pass
+
+    def take(self, filename, waiting=None):
+        # The prefetched BakedLevel for filename, or None when it was never asked for or couldn't be loaded.
+        # If the worker is still busy with it this waits, calling waiting() every so often to keep the
+        # window alive.
+        self.collect()
+        while filename in self.pending:
+            if waiting is not None:
+                waiting()
+            self.collect(timeout=0.05)
+        return self.ready.pop(filename, None)
+
+    def wait(self):
+        # Block until everything asked for so far is done
+        while self.pending:
+            self.collect(timeout=0.05)
+
+    def clear(self):
+        # Forget the levels that are ready but haven't been taken
+        for baked in self.ready.values():
+            baked.close()
+        self.ready.clear()
+
+    def close(self):
+        self.requests.put(None)
+        self.clear()
@@ -0,0 +1,137 @@
+import csv
+import json
+import time
+import pygame
+import settings
+import textcache
+
+
+class RingBuffer:
+    # Fixed size buffer of the most recent samples, oldest get overwritten
+    def __init__(self, size):
+        self.values = [0.0] * size
+        self.size = size
+        self.index = 0
+        self.count = 0
+
+    def append(self, value):
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def samples(self):
+        # oldest first
+        if self.count < self.size:
+            return self.values[:self.count]
+        return self.values[self.index:] + self.values[:self.index]
+
+    def percentiles(self, *points):
+        ordered = sorted(self.samples())
+        if not ordered:
+            return [0.0] * len(points)
+        return [ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] for point in points]
+
+
+class Section:
+    # Context manager that adds the time spent inside it to one named section of the current frame
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        current = self.profiler.current
+        current[self.name] = current.get(self.name, 0.0) + (time.perf_counter() - self.start) * 1000.0
+
+
+class FrameProfiler:
+    # Times named parts of every frame in milliseconds:
+    #     with game.profiler.section('draw'):
+    #         ...
+    # and keeps the last PROFILER_FRAMES frames of each in a ring buffer for p50 / p95 / p99 stats.
+    # With a trace file set it also keeps every frame and writes them out as csv or json at the end.
+    def __init__(self, size=settings.PROFILER_FRAMES, trace_file=None):
+        self.size = size
+        self.buffers = {}
+        self.sections = {}
+        self.current = {}
+        self.trace_file = trace_file
+        self.trace = []
+        self.frame_number = 0
+        self.last_frame = time.perf_counter()
+        self.font = None
+        self.background = None
+
+    def section(self, name):
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(self, name)
+        return section
+
+    def end_frame(self):
+        now = time.perf_counter()
+        self.current['frame'] = (now - self.last_frame) * 1000.0
+        self.last_frame = now
+
+        for name in self.current:
+            if name not in self.buffers:
+                self.buffers[name] = RingBuffer(self.size)
+        # sections that didn't run this frame (no update step, say) count as zero
+        for name, buffer in self.buffers.items():
+            buffer.append(self.current.get(name, 0.0))
+
+        if self.trace_file:
+            row = dict(self.current)
+            row['frame_number'] = self.frame_number
+            self.trace.append(row)
+        self.frame_number += 1
+        self.current = {}
+
+    def stats(self):
+        # {section: (p50, p95, p99)}
+        return {name: tuple(buffer.percentiles(50, 95, 99)) for name, buffer in self.buffers.items()}
+
+    def dump(self, filename=None):
+        filename = filename or self.trace_file
+        if not filename:
+            return
+        if filename.endswith('.json'):
+            with open(filename, 'w') as f:
+                json.dump({'stats': self.stats(), 'frames': self.trace}, f)
+        else:
+            names = ['frame_number'] + sorted(self.buffers)
+            with open(filename, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=names, restval=0.0)
+                writer.writeheader()
+                writer.writerows(self.trace)
+
+    def draw(self, surface, x, y):
+        # Frame time graph with a line at the frame budget, and the percentile stats underneath
+        graph_height = 100
+        if self.font is None:
+            self.font = textcache.get_font(14)
+            self.background = pygame.Surface((self.size, graph_height))
+            self.background.set_alpha(160)
+
+        scale = graph_height / (3 * 1000.0 / settings.FPS)
+        surface.blit(self.background, (x, y))
+
+        frames = self.buffers.get('frame')
+        if frames is not None:
+            for i, value in enumerate(frames.samples()):
+                height = min(graph_height, int(value * scale))
+                color = settings.GREEN if value <= 1000.0 / settings.FPS else settings.RED
+                pygame.draw.line(surface, color, (x + i, y + graph_height), (x + i, y + graph_height - height))
+        budget = y + graph_height - int(1000.0 / settings.FPS * scale)
+        pygame.draw.line(surface, settings.YELLOW, (x, budget), (x + self.size, budget))
+
+        line_y = y + graph_height + 4
+        header = '{:<24}{:>8}{:>8}{:>8}'.format('ms', 'p50', 'p95', 'p99')
+        surface.blit(self.font.render(header, True, settings.WHITE), (x, line_y))
+        for name, (p50, p95, p99) in sorted(self.stats().items()):
+            line_y += 16
+            text = '{:<24}{:>8.2f}{:>8.2f}{:>8.2f}'.format(name, p50, p95, p99)
+            surface.blit(self.font.render(text, True, settings.WHITE), (x, line_y))
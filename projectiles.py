@@ -0,0 +1,103 @@
+import numpy
+import settings
+import collision
+
+
+class BulletManager:
+    # Every live bullet in one set of preallocated arrays instead of one sprite each. update moves them all
+    # at once, drops the ones that left the loaded part of the map, and tests the stretch each one travelled
+    # against the level's BlockGrid in a single batch. Only bullets that crossed a partly covered cell get an
+    # exact test against the blocks, batched through the streamer's StaticGrid.
+    def __init__(self, game, capacity=settings.MAX_BULLETS):
+        self.game = game
+        self.capacity = capacity
+        self.image = game.yellow_bullet_img
+        self.width, self.height = self.image.get_size()
+
+        # top left corner of each bullet's rect
+        self.position = numpy.zeros((capacity, 2), dtype=numpy.int32)
+        self.previous = numpy.zeros((capacity, 2), dtype=numpy.int32)
+        self.velocity = numpy.zeros((capacity, 2), dtype=numpy.int32)
+        self.alive = numpy.zeros(capacity, dtype=bool)
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return self.capacity - len(self.free)
+
+    def spawn(self, center, direction):
+        if not self.free:
+            return False
+        i = self.free.pop()
+        self.position[i] = (center[0] - self.width // 2, center[1] - self.height // 2)
+        self.previous[i] = self.position[i]
+        self.velocity[i] = (settings.BULLET_SPEED if direction == 'right' else -settings.BULLET_SPEED, 0)
+        self.alive[i] = True
+        return True
+
+    def kill(self, indices):
+        self.alive[indices] = False
+        self.free.extend(int(i) for i in indices)
+
+    def clear(self):
+        self.kill(numpy.flatnonzero(self.alive))
+
+    def update(self):
+        live = numpy.flatnonzero(self.alive)
+        if not len(live):
+            return
+        self.previous[live] = self.position[live]
+        self.position[live] += self.velocity[live]
+
+        x = self.position[live, 0]
+        y = self.position[live, 1]
+        right = x + self.width - 1
+        bottom = y + self.height - 1
+
+        # Left the map, or the part of it that is streamed in. Blocks out there aren't loaded, and a bullet that
+        # far away is off the screen anyway.
+        window = self.game.streamer.window.clip(0, 0, self.game.map.width, self.game.map.height)
+        gone = (right < window.left) | (bottom < window.top) | (x >= window.right) | (y >= window.bottom)
+
+        # Test everything the bullet passed over this step, not just where it ended up, so no block is thin
+        # enough to fly through. Bullets only move along one axis, so that is exactly the box around both
+        # positions.
+        left = numpy.minimum(self.previous[live, 0], x)
+        top = numpy.minimum(self.previous[live, 1], y)
+        right = numpy.maximum(self.previous[live, 0], x) + self.width - 1
+        bottom = numpy.maximum(self.previous[live, 1], y) + self.height - 1
+        cells = self.game.collision_grid.area_max(left, top, right, bottom)
+        hit = cells == collision.BlockGrid.SOLID
+
+        partial = numpy.flatnonzero((cells == collision.BlockGrid.PARTIAL) & ~gone & ~hit)
+        if len(partial):
+            grid = self.game.streamer.static_grid()
+            left = left[partial]
+            top = top[partial]
+            right = right[partial] + 1
+            bottom = bottom[partial] + 1
+            blocks = grid.near(left, top, right, bottom)
+            found = blocks >= 0
+            blocks = numpy.where(found, blocks, 0)
+            touching = found & (left[:, None] < grid.right[blocks]) & (grid.left[blocks] < right[:, None]) & \
+                (top[:, None] < grid.bottom[blocks]) & (grid.top[blocks] < bottom[:, None])
+            hit[partial] = touching.any(axis=1)
+
+        dead = live[gone | hit]
+        if len(dead):
+            self.kill(dead)
+
+    def visible(self, camera, alpha=1.0):
+        # (image, screen position) for every bullet on screen, ready for Surface.blits
+        live = numpy.flatnonzero(self.alive)
+        if not len(live):
+            return []
+        position = self.position[live]
+        previous = self.previous[live]
+        drawn = numpy.rint(previous + (position - previous) * alpha).astype(numpy.int32)
+        drawn += camera.offset
+
+        view = camera.get_viewport()
+        on_screen = (drawn[:, 0] > -self.width) & (drawn[:, 0] < view.width) & \
+                    (drawn[:, 1] > -self.height) & (drawn[:, 1] < view.height)
+        image = self.image
+        return [(image, (x, y)) for x, y in drawn[on_screen].tolist()]
@@ -1,4 +1,13 @@
+import os
 import pygame
+
+# Headless mode runs the whole game without a window or a joystick, for regression and performance runs.
+# The video driver has to be picked before pygame starts, so it is switched on from the environment:
+# PLATFORMER_HEADLESS=1 python main.py
+HEADLESS = os.environ.get('PLATFORMER_HEADLESS', '0') not in ('', '0')
+if HEADLESS:
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
 pygame.init()
 
 # define colors
@@ -14,13 +23,28 @@ PURPLE = (128,   0, 128)
 BROWN  = (165,  42,  42)
 
 # game settings
-screen_resolution = pygame.display.Info()
-WIDTH = screen_resolution.current_w
-HEIGHT = screen_resolution.current_h
-FPS = 60
+if HEADLESS:
+    WIDTH = 1920
+    HEIGHT = 1080
+else:
+    screen_resolution = pygame.display.Info()
+    WIDTH = screen_resolution.current_w
+    HEIGHT = screen_resolution.current_h
+FPS = 60                                # simulation steps per second, the game always updates at this rate
+RENDER_FPS = 120                        # drawing is capped separately and interpolated between steps
+MAX_FRAME_STEPS = 5                     # most simulation steps run to catch up after one slow frame
+PROFILER_FRAMES = 300                   # frames of timing history kept for the debug overlay
+INTERPOLATION_SNAP = 64                 # anything moving further than this in one step is drawn without smoothing
 TITLE = 'Platformer Project'
 FONT = pygame.font.match_font('courier')
+TEXT_CACHE_SIZE = 256                   # most rendered strings kept around for reuse
 TILESIZE = 32
+CHUNK_SIZE = 16                         # map is rendered in square chunks of this many tiles
+CHUNK_CACHE_SIZE = 24                   # most chunk surfaces kept in memory at once
+SECTOR_SIZE = 32                        # blocks and interactables are loaded in square sectors of this many tiles
+DIRTY_RECTS = False                     # while the camera holds still only redraw and update what changed
+DIRTY_RECT_LIMIT = 64                   # more changed areas than this in one frame and the whole screen is redrawn
+MESSAGE_FRAMES = 180                    # frames a message like a gained ability stays on screen
 
 #PLAYER SETTINGS                        # BEST COMBO OF VALUES FOUND SO FAR
 PLAYER_WIDTH = 32
@@ -37,6 +61,9 @@ STARTING_ENERGY = 500                   # still deciding this energy stuff
 ENERGY_REGEN = 1                        # Don't use decimals
 ENERGY_COOLDOWN = 2500                  # time in milliseconds
 TELEPORT_MAGNITUDE = 100                # number of pixels instantly traveled
+DEPENETRATION_PASSES = 4                # most blocks a body stuck inside them gets pushed out of before it moves
+BULLET_SPEED = 20                       # pixels per frame
+MAX_BULLETS = 4096                      # bullets are pooled, shots past this many live ones are dropped
 
 # Joystick Buttons
 JOYBUTTONS = {
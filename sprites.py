@@ -1,21 +1,23 @@
 import pygame
 import settings
+import atlas
 
 
-# find a better way to add these single kinds of animations like this and the bullet one which are basically the same
 class SingleAnimation(pygame.sprite.Sprite):
-    def __init__(self, center, spritesheet, frame_rate):
+    # Plays one of the animations from atlas.ANIMATIONS once, then removes itself
+    def __init__(self, game, center, name, frame_rate, facing=None):
         pygame.sprite.Sprite.__init__(self)
-        self.spritesheet = spritesheet
-        self.image = spritesheet[0]
+        self.game = game
+        self.spritesheet = atlas.frames.get_animation(name, facing)
+        self.image = self.spritesheet[0]
         self.rect = self.image.get_rect()
         self.rect.center = center
         self.frame = 0
-        self.last_update = pygame.time.get_ticks()
+        self.last_update = self.game.get_ticks()
         self.frame_rate = frame_rate
 
     def update(self):
-        now = pygame.time.get_ticks()
+        now = self.game.get_ticks()
         if now - self.last_update > self.frame_rate:
             self.last_update = now
             self.frame += 1
@@ -28,50 +30,36 @@ class SingleAnimation(pygame.sprite.Sprite):
                 self.rect.center = center
 
 
-class Bullet(pygame.sprite.Sprite):
-    def __init__(self, game, center, direction):
-        pygame.sprite.Sprite.__init__(self, )
-        self.game = game
-        self.image = game.yellow_bullet_img
-        self.rect = self.image.get_rect()
-        self.rect.center = center
+class Block:
+    # Static level geometry. A level can have thousands of these and they never draw or update, so instead of
+    # a Sprite each one is a small __slots__ record: its rect, bounce direction and BlockType. Everything
+    # blocks of one kind share (friction, bounce, ...) lives on the BlockType.
+    __slots__ = ('rect', 'block_type', 'direction')
+
+    def __init__(self, x, y, w, h, type_id, direction):
+        self.rect = pygame.Rect(x, y, w, h)
+        self.block_type = BLOCK_TYPES[type_id]
         self.direction = direction
 
-    def update(self):
-        # Move bullet and collisions
-        if self.direction == 'right':
-            self.rect.x += 20
-        else:
-            self.rect.x -= 20
+    @property
+    def name(self):
+        return self.block_type.name
 
-        for block in self.game.blocks:
-            if self.rect.colliderect(block.rect):
-                self.kill()
+    @property
+    def friction(self):
+        return self.block_type.friction
 
+    @property
+    def bounce(self):
+        return self.block_type.bounce
 
-class Block(pygame.sprite.Sprite):
-    def __init__(self, game, x, y, w, h, name, direction):
-        if name == 'wall' or name == 'ice':
-            self.groups = game.blocks, game.walls
-        elif name == 'platform':
-            self.groups = game.blocks, game.platforms
-        else:
-            self.groups = game.blocks
-
-        pygame.sprite.Sprite.__init__(self, self.groups)
-        self.game = game
-        self.rect = pygame.Rect(x, y, w, h)
-        self.x = x
-        self.y = y
-        self.name = name
-        self.direction = direction
-        self.friction = BLOCKS[self.name]['friction']
-        self.bounce = BLOCKS[self.name]['bounce']
-        self.death = BLOCKS[self.name]['death']
+    @property
+    def death(self):
+        return self.block_type.death
 
 
 class Interactable(pygame.sprite.Sprite):
-    def __init__(self, game, x, y, w, h, name, img_on, img_off, ability):
+    def __init__(self, game, x, y, w, h, name, img_on, img_off, ability, order=None):
         self.groups = game.interactables
         pygame.sprite.Sprite.__init__(self, self.groups)
         self.game = game
@@ -82,6 +70,7 @@ class Interactable(pygame.sprite.Sprite):
         self.state = False
         self.rect = pygame.Rect(x, y, w, h)
         self.ability = ability
+        game.collision_index.add(self, order=order)
 
     def update(self):
         if self.state is False:
@@ -118,10 +107,20 @@ BLOCKS['death'] = {'friction': 0,
                    'death': True}
 
 
+class BlockType:
+    # The values shared by every block of one kind, BLOCK_TYPES[id] for each entry of BLOCKS
+    __slots__ = ('id', 'name', 'friction', 'bounce', 'death', 'wall', 'platform')
 
+    def __init__(self, id, name, friction, bounce, death):
+        self.id = id
+        self.name = name
+        self.friction = friction
+        self.bounce = bounce
+        self.death = death
+        # walls can be grabbed from the side, platforms only stop you from above
+        self.wall = name == 'wall' or name == 'ice'
+        self.platform = name == 'platform'
 
 
-
-
-
-
+BLOCK_TYPES = [BlockType(i, name, **values) for i, (name, values) in enumerate(BLOCKS.items())]
+BLOCK_TYPE_IDS = {block_type.name: block_type.id for block_type in BLOCK_TYPES}
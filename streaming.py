@@ -0,0 +1,127 @@
+import pygame
+import settings
+import sprites
+import collision
+
+
+class SectorStreamer:
+    # Keeps the level's blocks and interactables alive only near the player. The level is cut into square
+    # sectors of SECTOR_SIZE tiles. Everything within half a screen plus one sector of the player in every
+    # direction is loaded, and a sector is only dropped again once it is a sector further out than that, so
+    # walking back and forth over a border doesn't keep loading and unloading it. Objects that lie across a
+    # border belong to every sector they touch and stay alive while any of them is loaded, so collisions work
+    # the same on both sides.
+    #
+    # Objects are kept as plain spec tuples while unloaded, and interactables remember their state.
+    # Their spec index is their collision index order, so queries come back in level order however the
+    # sectors happened to be loaded.
+    #
+    # window is the part of the level that is always loaded, for things like bullets that have to be stopped
+    # by blocks, and static_grid batches the blocks in it for them.
+    def __init__(self, game, interactables, blocks, sector_size=settings.SECTOR_SIZE * settings.TILESIZE):
+        # interactables are (x, y, w, h, (name, ability)), blocks are (x, y, w, h, (block type id, direction))
+        self.game = game
+        self.sector_size = sector_size
+        self.specs = [('interactable', spec) for spec in interactables] + [('block', spec) for spec in blocks]
+        self.spans = []
+        self.sectors = {}
+        for index, (kind, (x, y, w, h, data)) in enumerate(self.specs):
+            keys = self.sector_keys(x, y, x + max(w, 1), y + max(h, 1))
+            self.spans.append(keys)
+            for key in keys:
+                self.sectors.setdefault(key, []).append(index)
+
+        self.loaded = set()
+        self.live = {}
+        self.states = {}
+        self.area = None
+        self.window = pygame.Rect(0, 0, 0, 0)
+        self.grid = None
+
+    def sector_keys(self, left, top, right, bottom):
+        size = self.sector_size
+        return [(x, y) for x in range(int(left) // size, (int(right) - 1) // size + 1)
+                for y in range(int(top) // size, (int(bottom) - 1) // size + 1)]
+
+    def update(self, center):
+        # Cheap unless the player crossed into another sector since last time
+        size = self.sector_size
+        x = int(center[0]) // size
+        y = int(center[1]) // size
+        across = -(-(settings.WIDTH // 2) // size) + 1
+        down = -(-(settings.HEIGHT // 2) // size) + 1
+        area = (x - across, y - down, x + across, y + down)
+        if area == self.area:
+            return
+        self.area = area
+        left, top, right, bottom = area
+        self.window = pygame.Rect(left * size, top * size, (right - left + 1) * size, (bottom - top + 1) * size)
+        self.grid = None
+
+        for key in list(self.loaded):
+            if not (left - 1 <= key[0] <= right + 1 and top - 1 <= key[1] <= bottom + 1):
+                self.unload(key)
+        for sx in range(left, right + 1):
+            for sy in range(top, bottom + 1):
+                if (sx, sy) not in self.loaded and (sx, sy) in self.sectors:
+                    self.load((sx, sy))
+
+    def load(self, key):
+        self.loaded.add(key)
+        for index in self.sectors[key]:
+            if index not in self.live:
+                self.live[index] = self.spawn(index)
+
+    def unload(self, key):
+        self.loaded.discard(key)
+        for index in self.sectors[key]:
+            obj = self.live.get(index)
+            if obj is None or any(other in self.loaded for other in self.spans[index]):
+                continue
+            if self.specs[index][0] == 'interactable':
+                self.states[index] = obj.state
+                obj.kill()
+            else:
+                self.game.blocks.discard(obj)
+            self.game.collision_index.remove(obj)
+            del self.live[index]
+
+    def static_grid(self):
+        # StaticGrid of the blocks in window, only built once something asks for it after the window moved
+        if self.grid is None:
+            level = self.window.clip(0, 0, self.game.map.width, self.game.map.height)
+            blocks = sorted(index for index in self.live if self.specs[index][0] == 'block')
+            self.grid = collision.StaticGrid(level.width, level.height, [self.specs[index][1] for index in blocks],
+                                             self.game.tile_grid, cell_size=self.game.map.tilewidth,
+                                             left=level.left, top=level.top)
+        return self.grid
+
+    def spawn(self, index):
+        kind, (x, y, w, h, data) = self.specs[index]
+        if kind == 'block':
+            type_id, direction = data
+            block = sprites.Block(x, y, w, h, type_id, direction)
+            self.game.blocks.add(block)
+            self.game.collision_index.add(block, order=index)
+            return block
+        name, ability = data
+        sprite = sprites.Interactable(self.game, x, y, w, h, name, self.game.button_down_img,
+                                      self.game.button_up_img, ability, order=index)
+        sprite.state = self.states.pop(index, False)
+        sprite.update()
+        return sprite
+
+    def reset(self):
+        # Back to how the level started: every interactable off, loaded or not
+        self.states.clear()
+        for index, sprite in self.live.items():
+            if self.specs[index][0] == 'interactable':
+                sprite.state = False
+                sprite.update()
+
+    def clear(self):
+        for key in list(self.loaded):
+            self.unload(key)
+        self.area = None
+        self.window = pygame.Rect(0, 0, 0, 0)
+        self.grid = None
@@ -0,0 +1,7 @@
+import os
+import sys
+from os import path
+
+# the game's modules live in the folder above, and the game has to run without a window
+os.environ['PLATFORMER_HEADLESS'] = '1'
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
@@ -0,0 +1,44 @@
+from os import path
+import numpy
+import pytest
+import collision
+import navigation
+import tilemap
+
+# collision.merge_blocks has to leave every pixel of the level covered by exactly as many blocks of each kind
+# as before, only by fewer rects.
+MAPS = ['Map1.tmx', 'Map2.tmx', 'testmap.tmx', '1920test.tmx']
+
+
+def coverage(specs, width, height):
+    # How many blocks of each key cover every pixel
+    counts = {}
+    for x, y, w, h, key in specs:
+        count = counts.setdefault(key, numpy.zeros((height, width), dtype=numpy.int16))
+        count[max(y, 0):y + h, max(x, 0):x + w] += 1
+    return counts
+
+
+def check_merge(specs, width, height):
+    merged = collision.merge_blocks(specs)
+    assert sum(w * h for x, y, w, h, key in merged) == sum(w * h for x, y, w, h, key in specs)
+    before = coverage(specs, width, height)
+    after = coverage(merged, width, height)
+    assert before.keys() == after.keys()
+    for key in before:
+        assert numpy.array_equal(before[key], after[key]), key
+    return merged
+
+
+def test_merges_only_whole_edges():
+    specs = [(0, 0, 32, 32, 'a'), (32, 0, 32, 32, 'a'), (0, 32, 64, 32, 'a'),
+             (64, 0, 32, 16, 'a'), (96, 0, 32, 32, 'b'), (128, 0, 32, 32, 'a')]
+    merged = check_merge(specs, 160, 64)
+    assert merged == [(0, 0, 64, 64, 'a'), (64, 0, 32, 16, 'a'), (96, 0, 32, 32, 'b'), (128, 0, 32, 32, 'a')]
+
+
+@pytest.mark.parametrize('map_name', MAPS)
+def test_merged_blocks_cover_the_same_cells(map_name):
+    level = tilemap.Map(path.join(navigation.GAME_FOLDER, 'maps', map_name), image_loader=tilemap.plain_image_loader)
+    specs = navigation.level_objects(level)[0]
+    check_merge([(int(x), int(y), int(w), int(h), key) for x, y, w, h, key in specs], level.width, level.height)
@@ -0,0 +1,102 @@
+import random
+import numpy
+import pytest
+import settings
+import collision
+import physics
+
+# PlayerBatch has to move exactly like Player. Every seed plays the real game with random input and a
+# different set of abilities, then all the seeds run again at once as a batch fed the same input, and the
+# hit box, velocity and energy have to match on every frame.
+MAPS = ['Map1.tmx', 'Map2.tmx', 'testmap.tmx', '1920test.tmx']
+SEEDS = range(8)
+FRAMES = 1200
+
+
+def random_script(frames, seed):
+    # ScriptedJoystick script that runs, sprints, grabs walls, jumps, teleports and drops through platforms at
+    # random
+    rng = random.Random(seed)
+    script = {}
+    for frame in range(0, frames, 20):
+        script[frame] = {'axes': {'LeftHorizontal': rng.choice([-1.0, -0.5, 0.0, 1.0, 1.0]),
+                                  'LeftVertical': rng.choice([0.0, 0.0, 0.0, 1.0]),
+                                  'Trigger': rng.choice([-1.0, 0.0, 0.9, 1.0])}}
+    frame = rng.randrange(10)
+    while frame < frames:
+        script.setdefault(frame, {}).setdefault('press', []).append('A')
+        frame += rng.randrange(1, 20)
+        script.setdefault(frame, {}).setdefault('release', []).append('A')
+        frame += rng.randrange(1, 40)
+    for frame in range(rng.randrange(60), frames, 90):
+        script.setdefault(frame, {}).setdefault('press', []).append(rng.choice(['LeftBumper', 'RightBumper']))
+        script.setdefault(frame + 1, {}).setdefault('release', []).append('LeftBumper')
+        script[frame + 1]['release'].append('RightBumper')
+    return script
+
+
+def abilities(seed):
+    return {'can_double_jump': seed % 2 == 1, 'can_sprint': seed % 3 != 0, 'can_wall_grab': seed % 4 >= 2,
+            'can_teleport': seed % 5 >= 3}
+
+
+def play(map_name, seed, frames):
+    # Plays the real game with random_script input, returns the player's state and the input on every frame,
+    # and the level's grid and spawn
+    import game
+    import inputs
+    app = game.Game(headless=True, joystick=inputs.ScriptedJoystick(random_script(frames, seed)))
+    app.new()
+    app.loader.wait()
+    app.clear_level()
+    app.load_level(map_name)
+    player = app.player
+    for name, value in abilities(seed).items():
+        setattr(player, name, value)
+    app.playing = True
+
+    states = []
+    controls = []
+    for frame in range(frames):
+        app.step()
+        frame_input = app.controls
+        controls.append((frame_input.get_axis(settings.JOYAXIS['LeftHorizontal']),
+                         frame_input.get_axis(settings.JOYAXIS['LeftVertical']),
+                         frame_input.get_axis(settings.JOYAXIS['Trigger']),
+                         frame_input.was_pressed('A'), frame_input.was_released('A'),
+                         frame_input.was_pressed('RightBumper') - frame_input.was_pressed('LeftBumper')))
+        states.append((player.hit_rect.x, player.hit_rect.y, player.velocity.x, player.velocity.y,
+                       player.current_energy))
+    grid = collision.StaticGrid(app.map.width, app.map.height,
+                                [spec for kind, spec in app.streamer.specs if kind == 'block'], app.tile_grid,
+                                cell_size=app.map.tilewidth)
+    spawn = app.spawn
+    app.loader.close()
+    return states, controls, grid, spawn
+
+
+@pytest.mark.parametrize('map_name', MAPS)
+def test_batch_matches_player(map_name):
+    seeds = list(SEEDS)
+    trajectories = []
+    recorded = []
+    for seed in seeds:
+        states, controls, grid, spawn = play(map_name, seed, FRAMES)
+        trajectories.append(states)
+        recorded.append(controls)
+
+    batch = physics.PlayerBatch(grid, len(seeds), spawn)
+    for i, seed in enumerate(seeds):
+        for name, value in abilities(seed).items():
+            getattr(batch, name)[i] = value
+
+    # first frame each seed went its own way on
+    first_difference = {seed: None for seed in seeds}
+    for frame in range(FRAMES):
+        batch.step(*[numpy.array(values) for values in zip(*[controls[frame] for controls in recorded])])
+        for i, seed in enumerate(seeds):
+            state = (int(batch.x[i]), int(batch.y[i]), float(batch.velocity_x[i]), float(batch.velocity_y[i]),
+                     int(batch.energy[i]))
+            if first_difference[seed] is None and state != trajectories[i][frame]:
+                first_difference[seed] = frame
+    assert first_difference == {seed: None for seed in seeds}
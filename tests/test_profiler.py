@@ -0,0 +1,56 @@
+import csv
+import json
+import profiler
+
+# The profiler's ring buffers past capacity, and the percentiles read from them.
+
+
+def test_ring_buffer_keeps_the_newest_samples():
+    buffer = profiler.RingBuffer(4)
+    assert buffer.samples() == []
+    for value in range(3):
+        buffer.append(float(value))
+    assert buffer.samples() == [0.0, 1.0, 2.0]
+    for value in range(3, 10):
+        buffer.append(float(value))
+    assert buffer.count == 4
+    assert buffer.samples() == [6.0, 7.0, 8.0, 9.0]
+
+
+def test_ring_buffer_percentiles():
+    buffer = profiler.RingBuffer(100)
+    assert buffer.percentiles(50, 99) == [0.0, 0.0]
+    # only the last 100 of these are left, 51 to 150 shuffled around
+    for value in list(range(1, 51)) + list(range(150, 50, -1)):
+        buffer.append(float(value))
+    assert buffer.percentiles(0, 50, 95, 99, 100) == [51.0, 101.0, 146.0, 150.0, 150.0]
+
+
+def test_frame_profiler_wraps_around(tmp_path):
+    trace = str(tmp_path / 'trace.json')
+    frames = profiler.FrameProfiler(size=10, trace_file=trace)
+    for frame in range(25):
+        frames.current['update'] = float(frame)
+        # draw only runs every other frame, the frames in between count as zero
+        if frame % 2:
+            frames.current['draw'] = 100.0
+        frames.end_frame()
+
+    assert frames.buffers['update'].samples() == [float(frame) for frame in range(15, 25)]
+    assert frames.buffers['draw'].samples() == [100.0, 0.0] * 5
+    stats = frames.stats()
+    assert stats['update'] == (20.0, 24.0, 24.0)
+    assert stats['draw'] == (100.0, 100.0, 100.0)
+
+    # the trace keeps every frame, not just the ones still in the buffers
+    frames.dump()
+    with open(trace) as f:
+        dumped = json.load(f)
+    assert [row['frame_number'] for row in dumped['frames']] == list(range(25))
+    assert dumped['stats']['update'] == [20.0, 24.0, 24.0]
+
+    frames.dump(str(tmp_path / 'trace.csv'))
+    with open(str(tmp_path / 'trace.csv')) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 25
+    assert float(rows[0]['draw']) == 0.0 and float(rows[1]['draw']) == 100.0
@@ -0,0 +1,67 @@
+import random
+import inputs
+import settings
+
+# Replay files: a frame record packs into 16 bytes and back unchanged, and a recorded run played back from
+# its file ends up in exactly the same state.
+FRAMES = 900
+
+
+def test_frame_record_is_16_bytes():
+    assert inputs.FRAME_RECORD.size == 16
+
+
+def test_frame_pack_round_trip():
+    axes = (inputs.AXIS_SCALE, -inputs.AXIS_SCALE, 0, 12345, -1)
+    pressed = 1 << settings.JOYBUTTONS['A'] | 1 << settings.JOYBUTTONS['RightStick']
+    released = 1 << settings.JOYBUTTONS['B']
+    frame = inputs.InputFrame(17, axes, pressed, released)
+    data = frame.pack()
+    assert len(data) == 16
+    copy = inputs.InputFrame.unpack(data)
+    assert (copy.elapsed, tuple(copy.axes), copy.pressed, copy.released) == (17, axes, pressed, released)
+    assert copy.get_axis(settings.JOYAXIS['LeftHorizontal']) == 1.0
+    assert copy.get_axis(settings.JOYAXIS['LeftVertical']) == -1.0
+    assert copy.was_pressed('A') and copy.was_pressed('RightStick') and not copy.was_pressed('B')
+    assert copy.was_released('B') and not copy.was_released('A')
+
+
+def script(frames, seed):
+    # runs, sprints, jumps and shoots at random
+    rng = random.Random(seed)
+    steps = {}
+    for frame in range(0, frames, 25):
+        steps[frame] = {'axes': {'LeftHorizontal': rng.choice([-1.0, 0.0, 1.0, 0.3]),
+                                 'Trigger': rng.choice([-1.0, 0.0, 0.9])}}
+    for frame in range(rng.randrange(10), frames - 10, 40):
+        steps.setdefault(frame, {}).setdefault('press', []).append(rng.choice(['A', 'B']))
+        steps.setdefault(frame + rng.randrange(1, 10), {}).setdefault('release', []).extend(['A', 'B'])
+    return steps
+
+
+def run(**options):
+    # Plays a game headless until it runs out of frames or replay, returns every frame's player state
+    import game
+    app = game.Game(headless=True, **options)
+    app.new()
+    player = app.player
+    player.can_double_jump = player.can_sprint = player.can_wall_grab = True
+    states = []
+    app.playing = True
+    for frame in range(FRAMES):
+        if app.input.finished:
+            break
+        app.step()
+        states.append((player.hit_rect.topleft, tuple(player.velocity), player.current_energy, len(app.bullets),
+                       app.input.ticks))
+    app.input.close()
+    app.loader.close()
+    return states
+
+
+def test_replay_matches_recording(tmp_path):
+    replay = str(tmp_path / 'run.rep')
+    recorded = run(joystick=inputs.ScriptedJoystick(script(FRAMES, 3)), record=replay)
+    played = run(replay=replay)
+    assert len(played) == len(recorded) == FRAMES
+    assert played == recorded
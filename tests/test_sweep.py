@@ -0,0 +1,113 @@
+import numpy
+import pygame
+import pytest
+import collision
+import physics
+import sprites
+
+# Swept movement: collision.time_of_impact and push_out on their own, then the player and the batch moving
+# far enough in one step to skip a thin wall, and starting a move stuck inside blocks.
+WALL = sprites.BLOCK_TYPE_IDS['wall']
+
+
+def test_time_of_impact_head_on():
+    assert collision.time_of_impact(pygame.Rect(0, 0, 10, 10), 20, 0, pygame.Rect(15, 0, 10, 10)) == (0.25, 0)
+    assert collision.time_of_impact(pygame.Rect(0, 20, 10, 10), 0, -40, pygame.Rect(0, 0, 10, 10)) == (0.25, 1)
+
+
+def test_time_of_impact_corner():
+    # reaching both faces at once counts as landing on the block
+    assert collision.time_of_impact(pygame.Rect(0, 0, 10, 10), 10, 10, pygame.Rect(15, 15, 10, 10)) == (0.5, 1)
+    # passing the corner without ever overlapping is a miss
+    assert collision.time_of_impact(pygame.Rect(0, 0, 10, 10), 20, 4, pygame.Rect(15, 15, 10, 10)) is None
+
+
+def test_time_of_impact_already_overlapping():
+    assert collision.time_of_impact(pygame.Rect(0, 0, 10, 10), 20, 0, pygame.Rect(5, 5, 10, 10)) is None
+
+
+def test_time_of_impact_zero_velocity():
+    assert collision.time_of_impact(pygame.Rect(0, 0, 10, 10), 0, 0, pygame.Rect(10, 0, 10, 10)) is None
+    assert collision.time_of_impact(pygame.Rect(0, 0, 10, 10), 0, 0, pygame.Rect(5, 0, 10, 10)) is None
+
+
+def test_time_of_impact_sliding_along_a_face():
+    assert collision.time_of_impact(pygame.Rect(0, 0, 10, 10), 30, 0, pygame.Rect(0, 10, 40, 10)) is None
+
+
+def test_push_out_takes_the_shortest_way():
+    ground = pygame.Rect(0, 100, 200, 50)
+    assert collision.push_out(pygame.Rect(50, 60, 24, 63), ground) == (0, -23)
+    assert collision.push_out(pygame.Rect(190, 80, 24, 63), ground) == (10, 0)
+    # a tie goes up
+    assert collision.push_out(pygame.Rect(0, 90, 10, 10), pygame.Rect(0, 90, 10, 10)) == (0, -10)
+
+
+@pytest.fixture(scope='module')
+def app():
+    import game
+    import inputs
+    app = game.Game(headless=True, joystick=inputs.ScriptedJoystick({}))
+    app.new()
+    app.loader.wait()
+    yield app
+    app.loader.close()
+
+
+def use_blocks(app, specs):
+    # Swaps the loaded level's blocks for specs and returns a StaticGrid of the same blocks for a batch
+    app.streamer.clear()
+    app.tile_grid = None
+    app.blocks = set()
+    app.collision_index = collision.SpatialHash()
+    for x, y, w, h, (type_id, direction) in specs:
+        block = sprites.Block(x, y, w, h, type_id, direction)
+        app.blocks.add(block)
+        app.collision_index.add(block)
+    return collision.StaticGrid(4096, 1024, specs)
+
+
+def player_move(app, start, dx, dy):
+    player = app.player
+    player.velocity.x = player.velocity.y = 0
+    player.hit_rect.topleft = start
+    player.move(dx, dy)
+    return player.hit_rect.topleft
+
+
+def batch_move(grid, starts, dx, dy):
+    batch = physics.PlayerBatch(grid, len(starts), starts[0])
+    batch.x[:] = [x for x, y in starts]
+    batch.y[:] = [y for x, y in starts]
+    batch.move(numpy.ones(len(starts), dtype=bool), numpy.full(len(starts), float(dx)),
+               numpy.full(len(starts), float(dy)))
+    return list(zip(batch.x.tolist(), batch.y.tolist()))
+
+
+def test_fast_move_stops_at_a_thin_wall(app):
+    grid = use_blocks(app, [(2000, 0, 2, 900, (WALL, None)), (0, 900, 4096, 2, (WALL, None))])
+    start = (100, 500)
+    assert player_move(app, start, 3000, 0) == (2000 - physics.HIT_WIDTH, 500)
+    assert batch_move(grid, [start], 3000, 0) == [(2000 - physics.HIT_WIDTH, 500)]
+    start = (3000, 500)
+    assert player_move(app, start, -2900, 0) == (2002, 500)
+    assert batch_move(grid, [start], -2900, 0) == [(2002, 500)]
+    start = (100, 0)
+    assert player_move(app, start, 0, 3000) == (100, 900 - physics.HIT_HEIGHT)
+    assert batch_move(grid, [start], 0, 3000) == [(100, 900 - physics.HIT_HEIGHT)]
+
+
+def test_move_pushes_out_of_blocks_it_starts_in(app):
+    specs = [(0, 600, 2000, 100, (WALL, None)), (1000, 0, 64, 600, (WALL, None))]
+    grid = use_blocks(app, specs)
+    starts = [(500, 550), (990, 300), (1050, 300), (995, 560), (500, 640)]
+    moved = [player_move(app, start, 0, 0) for start in starts]
+    assert moved[:3] == [(500, 537), (976, 300), (1064, 300)]
+    for position in moved:
+        rect = pygame.Rect(position, (physics.HIT_WIDTH, physics.HIT_HEIGHT))
+        assert rect.collidelist([pygame.Rect(x, y, w, h) for x, y, w, h, key in specs]) == -1
+    assert batch_move(grid, starts, 0, 0) == moved
+
+    # and then move on normally from there
+    moved = [player_move(app, start, 7, 5) for start in starts]
+    assert batch_move(grid, starts, 7, 5) == moved
@@ -0,0 +1,46 @@
+import pygame
+import pytest
+import textcache
+
+# TextCache hands back the same surface for the same (text, size, color) and drops the least recently used
+# ones past its size.
+WHITE = (255, 255, 255)
+RED = (255, 0, 0)
+
+
+@pytest.fixture(autouse=True)
+def fonts():
+    pygame.font.init()
+
+
+def test_same_key_is_a_hit():
+    cache = textcache.TextCache(8)
+    first = cache.render('Score', 18, WHITE)
+    assert cache.render('Score', 18, WHITE) is first
+    # colors are keyed by value, whatever sequence they come in
+    assert cache.render('Score', 18, list(WHITE)) is first
+    assert len(cache.surfaces) == 1
+
+
+def test_any_difference_is_a_miss():
+    cache = textcache.TextCache(8)
+    first = cache.render('Score', 18, WHITE)
+    assert cache.render('Score', 20, WHITE) is not first
+    assert cache.render('Score', 18, RED) is not first
+    assert cache.render('Score!', 18, WHITE) is not first
+    assert cache.render('Score', 18, WHITE, antialias=False) is not first
+    assert len(cache.surfaces) == 5
+
+
+def test_least_recently_used_is_evicted():
+    cache = textcache.TextCache(3)
+    a = cache.render('a', 18, WHITE)
+    cache.render('b', 18, WHITE)
+    cache.render('c', 18, WHITE)
+    # using a makes b the oldest
+    assert cache.render('a', 18, WHITE) is a
+    cache.render('d', 18, WHITE)
+    assert [key[0] for key in cache.surfaces] == ['c', 'a', 'd']
+    assert cache.render('a', 18, WHITE) is a
+    cache.render('b', 18, WHITE)
+    assert [key[0] for key in cache.surfaces] == ['d', 'a', 'b']
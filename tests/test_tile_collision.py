@@ -0,0 +1,113 @@
+import numpy
+import pygame
+import pytest
+import pytmx
+import collision
+import sprites
+import tilemap
+
+# Tile collision: the "Block" tile property read out of the tilesets, and the grids built from it.
+WALL = sprites.BLOCK_TYPE_IDS['wall']
+ICE = sprites.BLOCK_TYPE_IDS['ice']
+EMPTY = collision.TileGrid.EMPTY
+
+TMX = '''<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.0" orientation="orthogonal" renderorder="right-down" width="4" height="3" tilewidth="32"
+     tileheight="32" nextobjectid="1">
+ <tileset firstgid="1" name="terrain" tilewidth="32" tileheight="32" tilecount="4" columns="2">
+  <tile id="0"><properties><property name="Block" value="wall"/></properties></tile>
+  <tile id="1"><properties><property name="Block" value="{second}"/></properties></tile>
+ </tileset>
+ <layer name="ground" width="4" height="3">
+  <data encoding="csv">
+1,0,0,3,
+0,0,0,0,
+1,1,1,1
+</data>
+ </layer>
+ <layer name="details" width="4" height="3">
+  <data encoding="csv">
+0,0,2,0,
+0,0,0,0,
+0,2,0,0
+</data>
+ </layer>
+</map>
+'''
+
+
+def load_map(folder, second='ice'):
+    filename = str(folder / 'tiles.tmx')
+    with open(filename, 'w') as f:
+        f.write(TMX.format(second=second))
+    return pytmx.TiledMap(filename)
+
+
+def test_tile_blocks_reads_block_property(tmp_path):
+    # tiles without the property stay empty and later layers win
+    grid = tilemap.tile_blocks(load_map(tmp_path))
+    assert grid.tolist() == [[WALL, EMPTY, ICE, EMPTY],
+                             [EMPTY, EMPTY, EMPTY, EMPTY],
+                             [WALL, ICE, WALL, WALL]]
+
+
+def test_tile_blocks_rejects_unknown_block_type(tmp_path):
+    with pytest.raises(ValueError, match="tile 1 of tileset terrain in .*tiles.tmx has an unknown Block type 'lava'"):
+        tilemap.tile_blocks(load_map(tmp_path, 'lava'))
+
+
+def test_tile_blocks_rejects_bounce_tiles(tmp_path):
+    with pytest.raises(ValueError):
+        tilemap.tile_blocks(load_map(tmp_path, 'bounce'))
+
+
+def test_tile_grid_blocks_in(tmp_path):
+    tiles = collision.TileGrid(tilemap.tile_blocks(load_map(tmp_path)), 32, 32)
+    blocks = tiles.blocks_in(pygame.Rect(40, 40, 40, 40))
+    assert [(tuple(block.rect), block.name) for block in blocks] == [((32, 64, 32, 32), 'ice'),
+                                                                     ((64, 64, 32, 32), 'wall')]
+    # the same records every time instead of new ones per query
+    assert tiles.blocks_in(pygame.Rect(40, 40, 40, 40)) == blocks
+    assert tiles.blocks_in(pygame.Rect(200, 0, 10, 10)) == []
+
+
+def test_block_grid_cells():
+    tiles = collision.TileGrid(numpy.array([[WALL, EMPTY], [EMPTY, EMPTY]], dtype=numpy.uint8), 32, 32)
+    grid = collision.BlockGrid(64, 64, [pygame.Rect(40, 40, 8, 8)], tiles=tiles)
+    assert grid.cells.tolist() == [[collision.BlockGrid.SOLID, collision.BlockGrid.EMPTY],
+                                   [collision.BlockGrid.EMPTY, collision.BlockGrid.PARTIAL]]
+    points = numpy.array([0, 40, 40, 100]), numpy.array([0, 0, 40, 0])
+    assert grid.lookup(*points).tolist() == [collision.BlockGrid.SOLID, collision.BlockGrid.EMPTY,
+                                             collision.BlockGrid.PARTIAL, collision.BlockGrid.EMPTY]
+    assert grid.area_max(numpy.array([33]), numpy.array([0]), numpy.array([63]), numpy.array([63])).tolist() == \
+        [collision.BlockGrid.PARTIAL]
+
+
+def test_static_grid_numbers_objects_then_tiles():
+    tiles = collision.TileGrid(numpy.array([[EMPTY, ICE], [WALL, EMPTY]], dtype=numpy.uint8), 32, 32)
+    grid = collision.StaticGrid(64, 64, [(0, 0, 20, 20, (WALL, None))], tiles)
+    assert grid.left.tolist() == [0, 32, 0]
+    assert grid.top.tolist() == [0, 0, 32]
+    assert grid.types.tolist() == [WALL, ICE, WALL]
+    near = grid.near(numpy.array([0]), numpy.array([0]), numpy.array([10]), numpy.array([10]))
+    assert sorted(set(near[0].tolist()) - {-1}) == [0]
+    near = grid.near(numpy.array([0]), numpy.array([0]), numpy.array([64]), numpy.array([64]))
+    assert sorted(set(near[0].tolist()) - {-1}) == [0, 1, 2]
+
+
+def test_static_grid_over_part_of_the_level():
+    tiles = collision.TileGrid(numpy.array([[EMPTY, ICE, EMPTY], [WALL, EMPTY, WALL]], dtype=numpy.uint8), 32, 32)
+    grid = collision.StaticGrid(64, 64, [(40, 10, 40, 10, (WALL, None))], tiles, left=32)
+    assert grid.left.tolist() == [40, 32, 64]
+    assert grid.top.tolist() == [10, 0, 32]
+    near = grid.near(numpy.array([0, 64]), numpy.array([32, 0]), numpy.array([32, 96]), numpy.array([64, 32]))
+    assert sorted(set(near[0].tolist()) - {-1}) == []
+    assert sorted(set(near[1].tolist()) - {-1}) == [0]
+
+
+def test_grids_reject_tiles_of_another_size():
+    tiles = collision.TileGrid(numpy.full((2, 2), WALL, dtype=numpy.uint8), 16, 16)
+    with pytest.raises(ValueError):
+        collision.BlockGrid(64, 64, [], tiles=tiles)
+    with pytest.raises(ValueError):
+        collision.StaticGrid(64, 64, [], tiles)
@@ -0,0 +1,82 @@
+import pygame
+import settings
+from collections import OrderedDict
+
+# Loaded fonts, one per size. Opening the font file is by far the slowest part of drawing text.
+fonts = {}
+
+
+def get_font(size):
+    font = fonts.get(size)
+    if font is None:
+        font = fonts[size] = pygame.font.Font(settings.FONT, size)
+    return font
+
+
+class TextCache:
+    # Rendered text surfaces keyed by (text, size, color, antialias), least recently used ones get dropped
+    # once there are more than TEXT_CACHE_SIZE. Callers get the very same Surface back, so don't draw on it.
+    def __init__(self, size=settings.TEXT_CACHE_SIZE):
+        self.size = size
+        self.surfaces = OrderedDict()
+
+    def render(self, text, size, color, antialias=True):
+        key = (text, size, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = get_font(size).render(text, antialias, color)
+            while len(self.surfaces) > self.size:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+
+class TextLayer:
+    # Strings that rarely change (titles, menus, HUD labels) composed onto one surface, so drawing all of them
+    # is a single blit. Each line has a key to replace or remove it by, and the surface is only put back
+    # together after something actually changed.
+    def __init__(self, text_cache=None):
+        self.text_cache = text_cache or cache
+        self.lines = OrderedDict()
+        self.surface = None
+        self.rect = None
+
+    def set(self, key, text, size, color, x, y, centered=False):
+        image = self.text_cache.render(text, size, color)
+        rect = image.get_rect()
+        if centered:
+            rect.midtop = (x, y)
+        else:
+            rect.topleft = (x, y)
+        if self.lines.get(key) != (image, rect):
+            self.lines[key] = (image, rect)
+            self.surface = None
+
+    def remove(self, key):
+        if self.lines.pop(key, None) is not None:
+            self.surface = None
+
+    def clear(self):
+        self.lines.clear()
+        self.surface = None
+
+    def compose(self):
+        rects = [rect for image, rect in self.lines.values()]
+        self.rect = rects[0].unionall(rects[1:])
+        self.surface = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        for image, rect in self.lines.values():
+            self.surface.blit(image, rect.move(-self.rect.x, -self.rect.y))
+
+    def draw(self, surface):
+        if not self.lines:
+            return
+        if self.surface is None:
+            self.compose()
+        surface.blit(self.surface, self.rect)
+
+
+cache = TextCache()
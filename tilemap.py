@@ -1,29 +1,201 @@
+import numpy
 import pytmx
 import pygame
 import settings
+import levelcache
+import collision
+import sprites
+from collections import OrderedDict
+
+
+class MapObject:
+    # Plain copy of a Tiled object, so levels read from the cache look the same to the game as parsed ones.
+    # Custom properties become attributes just like pytmx does it (tile_object.Direction)
+    def __init__(self, type, name, x, y, width, height, properties):
+        self.type = type
+        self.name = name
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.properties = properties
+        for key, value in properties.items():
+            setattr(self, key, value)
+
+    def to_dict(self):
+        return {'type': self.type, 'name': self.name, 'x': self.x, 'y': self.y,
+                'width': self.width, 'height': self.height, 'properties': self.properties}
+
+
+def plain_image_loader(filename, colorkey, **kwargs):
+    # pytmx image loader that leaves tiles exactly as loaded instead of convert()ing them for the display,
+    # so a level can be parsed and baked away from the main thread
+    image = pygame.image.load(filename)
+    if colorkey:
+        colorkey = pygame.Color('#' + colorkey)
+
+    def load_image(rect=None, flags=None):
+        tile = image.subsurface(rect).copy() if rect else image.copy()
+        if flags:
+            tile = pytmx.util_pygame.handle_transformation(tile, flags)
+        if colorkey:
+            tile.set_colorkey(colorkey)
+        return tile
+
+    return load_image
+
+
+def tile_blocks(tm):
+    # Tile collision grid for a parsed map: the BlockType id of each tile, from a "Block" property on tiles in
+    # the tilesets (Block = wall), or collision.TileGrid.EMPTY. Later layers win where layers overlap.
+    # None when no tile has the property, so levels built only from objects don't carry an empty grid.
+    types = {}
+    for gid, properties in tm.tile_properties.items():
+        name = properties.get('Block')
+        if name:
+            if name == 'bounce':
+                raise ValueError('bounce blocks need a Direction, place them as objects: ' + tm.filename)
+            if name not in sprites.BLOCK_TYPE_IDS:
+                raise ValueError('tile {} of tileset {} in {} has an unknown Block type {!r}'.format(
+                    properties.get('id'), tm.get_tileset_from_gid(gid).name, tm.filename, name))
+            types[gid] = sprites.BLOCK_TYPE_IDS[name]
+    if not types:
+        return None
+
+    lookup = numpy.full(max(max(types), len(tm.images)) + 1, collision.TileGrid.EMPTY, dtype=numpy.uint8)
+    for gid, type_id in types.items():
+        lookup[gid] = type_id
+    grid = numpy.full((tm.height, tm.width), collision.TileGrid.EMPTY, dtype=numpy.uint8)
+    for layer in tm.layers:
+        if isinstance(layer, pytmx.TiledTileLayer):
+            cells = lookup[numpy.array(layer.data, dtype=numpy.int64)]
+            grid = numpy.where(cells != collision.TileGrid.EMPTY, cells, grid)
+    return grid
 
 
 class Map:
-    def __init__(self, filename):
-        tm = pytmx.load_pygame(filename, pixelalpha=True)
+    def __init__(self, filename, cache_folder=None, baked=None, image_loader=None):
+        # baked is an already opened BakedLevel for this file, image_loader replaces the pytmx pygame one
+        self.filename = filename
+        self.tmxdata = None
+        self.baked = baked
 
-        self.width = tm.width * tm.tilewidth
-        self.height = tm.height * tm.tileheight
-        self.tmxdata = tm
+        # use the pre-baked level when the tmx and its tilesets haven't changed since it was written
+        if self.baked is None and cache_folder:
+            self.baked = levelcache.load(cache_folder, filename)
+
+        if self.baked is None:
+            if image_loader is None:
+                tm = pytmx.load_pygame(filename, pixelalpha=True)
+            else:
+                tm = pytmx.TiledMap(filename, image_loader=image_loader, pixelalpha=True)
+            self.tmxdata = tm
+            self.width = tm.width * tm.tilewidth
+            self.height = tm.height * tm.tileheight
+            self.tilewidth = tm.tilewidth
+            self.tileheight = tm.tileheight
+            self.objects = [MapObject(obj.type, obj.name, obj.x, obj.y, obj.width, obj.height, dict(obj.properties))
+                            for obj in tm.objects]
+            self.tile_blocks = tile_blocks(tm)
+            if cache_folder:
+                levelcache.save(cache_folder, filename, self, [obj.to_dict() for obj in self.objects],
+                                settings.CHUNK_SIZE * self.tilewidth, settings.CHUNK_SIZE * self.tileheight,
+                                self.tile_blocks)
+                self.baked = levelcache.load(cache_folder, filename)
+                if self.baked is not None:
+                    # everything gets drawn from the bake now, no need to hold on to all the tile images
+                    self.tmxdata = None
+        else:
+            self.width = self.baked.width
+            self.height = self.baked.height
+            self.tilewidth = self.baked.tilewidth
+            self.tileheight = self.baked.tileheight
+            self.objects = [MapObject(**obj) for obj in self.baked.objects]
+            self.tile_blocks = self.baked.tile_blocks
+
+    def render_area(self, surface, area):
+        # Render only the tiles inside area (in pixels), drawn relative to the area's top left corner
+        if self.baked is not None:
+            clipped = area.clip(0, 0, self.width, self.height)
+            if clipped.width and clipped.height:
+                pixels = pygame.image.frombuffer(self.baked.read_area(clipped), clipped.size, 'RGB')
+                surface.blit(pixels, (clipped.x - area.x, clipped.y - area.y))
+            return
+
+        tile_w = self.tmxdata.tilewidth
+        tile_h = self.tmxdata.tileheight
+        first_x = max(0, area.left // tile_w)
+        first_y = max(0, area.top // tile_h)
+        last_x = min(self.tmxdata.width, -(-area.right // tile_w))
+        last_y = min(self.tmxdata.height, -(-area.bottom // tile_h))
 
-    def render(self, surface):
         for layer in self.tmxdata.visible_layers:
             if isinstance(layer, pytmx.TiledTileLayer):
-                for x, y, gid, in layer:
-                    tile = self.tmxdata.get_tile_image_by_gid(gid)
-                    if tile:
-                        surface.blit(tile, (x * self.tmxdata.tilewidth,
-                                            y * self.tmxdata.tileheight))
+                for y in range(first_y, last_y):
+                    row = layer.data[y]
+                    for x in range(first_x, last_x):
+                        tile = self.tmxdata.get_tile_image_by_gid(row[x])
+                        if tile:
+                            surface.blit(tile, (x * tile_w - area.left, y * tile_h - area.top))
+
+    def render_strip(self, top, height):
+        # RGB bytes of a full width band of the level, used when baking it into the cache
+        strip = pygame.Surface((self.width, height))
+        self.render_area(strip, pygame.Rect(0, top, self.width, height))
+        return pygame.image.tostring(strip, 'RGB')
+
+
+class ChunkedMapRenderer:
+    # Draws the map from fixed size chunk surfaces instead of one surface the size of the whole level.
+    # Chunks are rendered the first time they come into view, and the least recently seen ones are thrown
+    # away once there are more than CHUNK_CACHE_SIZE of them, so memory stays the same for any map size.
+    def __init__(self, tilemap, chunk_tiles=settings.CHUNK_SIZE, cache_size=settings.CHUNK_CACHE_SIZE):
+        self.map = tilemap
+        self.chunk_width = chunk_tiles * tilemap.tilewidth
+        self.chunk_height = chunk_tiles * tilemap.tileheight
+        self.chunks = OrderedDict()
 
-    def make_map(self):
-        temp_surface = pygame.Surface((self.width, self.height))
-        self.render(temp_surface)
-        return temp_surface
+        # never allow fewer chunks than it takes to cover the screen, or chunks get rebuilt every frame
+        across = settings.WIDTH // self.chunk_width + 2
+        down = settings.HEIGHT // self.chunk_height + 2
+        self.cache_size = max(cache_size, across * down)
+
+    def get_chunk(self, key):
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            area = pygame.Rect(key[0] * self.chunk_width, key[1] * self.chunk_height,
+                               self.chunk_width, self.chunk_height).clip(0, 0, self.map.width, self.map.height)
+            chunk = pygame.Surface(area.size)
+            self.map.render_area(chunk, area)
+            self.chunks[key] = chunk
+            while len(self.chunks) > self.cache_size:
+                self.chunks.popitem(last=False)
+        else:
+            self.chunks.move_to_end(key)
+        return chunk
+
+    def draw(self, surface, camera, area=None):
+        # area limits drawing to that rect of the screen, for redrawing only the parts that changed
+        view = camera.get_viewport()
+        if area is not None:
+            view = view.clip(area.move(-camera.offset[0], -camera.offset[1]))
+            if not view:
+                return
+        first_x = max(0, view.left // self.chunk_width)
+        first_y = max(0, view.top // self.chunk_height)
+        last_x = (min(view.right, self.map.width) - 1) // self.chunk_width
+        last_y = (min(view.bottom, self.map.height) - 1) // self.chunk_height
+
+        for cy in range(first_y, last_y + 1):
+            for cx in range(first_x, last_x + 1):
+                chunk = self.get_chunk((cx, cy))
+                x = cx * self.chunk_width
+                y = cy * self.chunk_height
+                if area is None:
+                    surface.blit(chunk, (x + camera.offset[0], y + camera.offset[1]))
+                else:
+                    part = view.clip(x, y, chunk.get_width(), chunk.get_height())
+                    surface.blit(chunk, (part.x + camera.offset[0], part.y + camera.offset[1]), part.move(-x, -y))
 
 
 class Camera:
@@ -31,14 +203,30 @@ class Camera:
         self.camera = pygame.Rect(0, 0, width, height)
         self.width = width
         self.height = height
+        # offset is what drawing uses, somewhere between the last two simulated camera positions
+        self.previous = self.camera.topleft
+        self.offset = self.camera.topleft
 
     def apply(self, entity):
-        return entity.rect.move(self.camera.topleft)
+        return entity.rect.move(self.offset)
 
     def apply_rect(self, rect):
-        return rect.move(self.camera.topleft)
+        return rect.move(self.offset)
+
+    def get_viewport(self):
+        # The part of the map that is on screen, in map coordinates
+        return pygame.Rect(-self.offset[0], -self.offset[1], settings.WIDTH, settings.HEIGHT)
+
+    def interpolate(self, alpha):
+        dx = self.camera.x - self.previous[0]
+        dy = self.camera.y - self.previous[1]
+        if abs(dx) > settings.INTERPOLATION_SNAP or abs(dy) > settings.INTERPOLATION_SNAP:
+            self.offset = self.camera.topleft
+        else:
+            self.offset = (round(self.previous[0] + dx * alpha), round(self.previous[1] + dy * alpha))
 
     def update(self, target):
+        self.previous = self.camera.topleft
         x = -target.rect.centerx + int(settings.WIDTH / 2)
         y = -target.rect.centery + int(settings.HEIGHT / 2)
 
@@ -47,4 +235,5 @@ class Camera:
         y = min(0, y)  # top
         x = max(-(self.width - settings.WIDTH), x)  # right
         y = max(-(self.height - settings.HEIGHT), y)  # bottom
-        self.camera = pygame.Rect(x, y, self.width, self.height)
\ No newline at end of file
+        self.camera = pygame.Rect(x, y, self.width, self.height)
+        self.offset = self.camera.topleft
\ No newline at end of file
@@ -0,0 +1,309 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import numpy
+from concurrent.futures import ProcessPoolExecutor
+from os import path
+
+# Level validation farm: checks every map can still be finished and nobody spawns inside a death block.
+#     python validate.py                              every map in maps/, replays from replays/ if there are any
+#     python validate.py Map2.tmx --seeds 16 --agents 128 --frames 3600 --workers 8 --output results.json
+#     python validate.py --replays runs/ --strict
+# Work is split into jobs, one map and seed or one replay file each, and fanned out over a process pool.
+# A seed runs a batch of simulated players (physics.PlayerBatch) with random input on the map, a replay plays
+# a recording made with PLATFORMER_RECORD through the real game. A map passes when a replay or any simulated
+# player reaches its exit, or when its saved navigation graph (python navigation.py) says the exit can be
+# reached. It fails when its spawn is in a death block, it has no exit, a replay of it no longer reaches the
+# exit, or nothing got to the exit and its navigation graph says nothing can. When nothing got to the exit and
+# there is no up to date graph to ask, it is unverified.
+# What each map has to live up to comes from the policy file, maps/validation.json by default:
+#     {"testmap.tmx": {"exit": false}, "Map1.tmx": {"required": true}}
+# "exit": false is for test maps that have no exit, they get skipped instead of failing for it, and
+# "required": true fails the map when it is unverified. --strict makes every map required.
+# Every worker keeps one headless game and what it needs of the levels it has loaded, so each map is only
+# loaded once per worker however many jobs for it the worker gets.
+GAME_FOLDER = path.dirname(path.abspath(__file__))
+SIMULATION_AGENTS = 64
+SIMULATION_FRAMES = 3600
+SIMULATION_SEEDS = 4
+# the abilities the game's buttons hand out, a map only has to be possible with all of them
+ABILITIES = ('double_jump', 'sprint')
+POLICY = {'exit': True, 'required': False}
+
+worker_game = None
+worker_levels = {}
+
+
+def start_worker():
+    os.environ['PLATFORMER_HEADLESS'] = '1'
+    sys.path.insert(0, GAME_FOLDER)
+
+
+def get_game():
+    global worker_game
+    if worker_game is None:
+        import game
+        worker_game = game.Game(headless=True)
+        # replays stop at the exit instead of going on to the next level
+        worker_game.advance_levels = False
+        worker_game.new()
+        # don't let it bake the next level in the background for nothing
+        worker_game.loader.wait()
+        worker_game.loader.clear()
+    return worker_game
+
+
+def use_level(map_file):
+    # Puts map_file in the worker's game, loading it only the first time, and returns its level info
+    import collision
+    import physics
+    app = get_game()
+    if path.normpath(app.map_path) != path.normpath(map_file):
+        app.clear_level()
+        app.load_level(map_file)
+        app.loader.wait()
+        app.loader.clear()
+    else:
+        app.restart_level()
+
+    level = worker_levels.get(map_file)
+    if level is None:
+        # agents go all over the level, so they get a grid of all of it, not just what is streamed in
+        grid = collision.StaticGrid(app.map.width, app.map.height,
+                                    [spec for kind, spec in app.streamer.specs if kind == 'block'], app.tile_grid,
+                                    cell_size=app.map.tilewidth)
+        # the hit box where the player starts against every death block it touches
+        x = physics.round_rect(numpy.array([app.spawn[0]]))
+        y = physics.round_rect(numpy.array([app.spawn[1]]))
+        blocks = grid.near(x, y, x + physics.HIT_WIDTH, y + physics.HIT_HEIGHT)[0]
+        blocks = blocks[blocks >= 0]
+        inside = physics.overlaps(x, y, x + physics.HIT_WIDTH, y + physics.HIT_HEIGHT,
+                                  grid.left[blocks], grid.top[blocks], grid.right[blocks], grid.bottom[blocks])
+        level = {
+            'grid': grid,
+            'navigable': navigable(map_file),
+            'spawn': app.spawn,
+            'spawn_in_death': bool((inside & physics.DEATH[grid.types[blocks]]).any()),
+            'exits': [(x, y, x + w, y + h) for kind, (x, y, w, h, (name, ability)) in app.streamer.specs
+                      if kind == 'interactable' and name == 'exit'],
+        }
+        worker_levels[map_file] = level
+    return app, level
+
+
+def navigable(map_file):
+    # Whether the saved navigation graph of map_file can get from the spawn to an exit, None when there is no
+    # up to date graph
+    import navigation
+    graph = navigation.load(map_file)
+    if graph is None:
+        return None
+    return graph.completable(ABILITIES)
+
+
+def level_info(map_file):
+    # Level info of map_file, simulations don't need it in the game so it's only loaded there the first time
+    level = worker_levels.get(map_file)
+    if level is None:
+        app, level = use_level(map_file)
+    return level
+
+
+def simulate(map_file, seed, agents, frames):
+    # One batch of simulated players with random input
+    import physics
+    start = time.perf_counter()
+    level = level_info(map_file)
+    loaded = time.perf_counter()
+
+    result = {'job': 'simulate', 'map': path.basename(map_file), 'seed': seed, 'agents': agents,
+              'spawn_in_death': level['spawn_in_death'], 'exits': len(level['exits']),
+              'navigable': level['navigable'], 'reached': 0, 'first_frame': None, 'deaths': 0}
+    if level['exits'] and not level['spawn_in_death']:
+        rng = numpy.random.default_rng(seed)
+        batch = physics.PlayerBatch(level['grid'], agents, level['spawn'])
+        batch.can_double_jump[:] = True
+        batch.can_sprint[:] = True
+        reached = numpy.zeros(agents, dtype=bool)
+        holding = numpy.zeros(agents, dtype=bool)
+        for frame in range(frames):
+            # new stick and trigger every 20 frames, A pressed and held for a while now and then
+            if frame % 20 == 0:
+                horizontal = rng.choice([-1.0, 0.0, 1.0], agents)
+                vertical = rng.choice([0.0, 0.0, 0.0, 1.0], agents)
+                trigger = rng.choice([-1.0, 0.0, 1.0], agents)
+            pressed = ~holding & (rng.random(agents) < 0.08)
+            released = holding & (rng.random(agents) < 0.1)
+            holding = (holding | pressed) & ~released
+            batch.step(horizontal, vertical, trigger, pressed, released)
+
+            for left, top, right, bottom in level['exits']:
+                at_exit = physics.overlaps(batch.x, batch.y, batch.x + physics.HIT_WIDTH, batch.y + physics.HIT_HEIGHT,
+                                           left, top, right, bottom)
+                if result['first_frame'] is None and at_exit.any():
+                    result['first_frame'] = frame
+                reached |= at_exit
+            if reached.all():
+                break
+        result['reached'] = int(reached.sum())
+        result['deaths'] = int(batch.deaths.sum())
+
+    result['load_ms'] = (loaded - start) * 1000
+    result['run_ms'] = (time.perf_counter() - loaded) * 1000
+    return [result]
+
+
+def replay(replay_file):
+    # Plays a recording through the real game from the level it starts on, passes if it gets to the exit
+    import inputs
+    import player
+    start = time.perf_counter()
+    app = get_game()
+    app.input.close()
+    app.input = inputs.InputSystem(app.joystick, replay=replay_file)
+    app.level_number = app.input.start(0)
+    map_file = path.abspath(path.join(app.map_folder, app.levels[app.level_number]))
+    app, level = use_level(map_file)
+
+    # a fresh player with no abilities, like at the start of the level
+    app.player.kill()
+    app.player = player.Player(app, 0, 0)
+    app.place_player(*app.spawn)
+    loaded = time.perf_counter()
+
+    app.completed_frame = None
+    frames = 0
+    app.playing = True
+    while app.playing and not app.input.finished and app.completed_frame is None:
+        app.step()
+        frames += 1
+    app.input.close()
+    reached = [] if app.completed_frame is None else [app.completed_frame]
+
+    return [{'job': 'replay', 'map': path.basename(map_file), 'replay': path.basename(replay_file),
+             'spawn_in_death': level['spawn_in_death'], 'exits': len(level['exits']),
+             'navigable': level['navigable'], 'reached': len(reached),
+             'first_frame': reached[0] if reached else None, 'frames': frames,
+             'load_ms': (loaded - start) * 1000, 'run_ms': (time.perf_counter() - loaded) * 1000}]
+
+
+def run_job(job):
+    # list of results from one job
+    kind, args = job
+    if kind == 'simulate':
+        return simulate(*args)
+    return replay(*args)
+
+
+def summarize(results, policies, strict):
+    # {map: summary} from all the job results, policies are the {map: policy} from the policy file
+    maps = {}
+    for result in results:
+        summary = maps.setdefault(result['map'], {'status': None, 'problems': [], 'spawn_in_death': False,
+                                                  'exits': result['exits'], 'navigable': result['navigable'],
+                                                  'simulated_agents': 0, 'reached': 0, 'replays': 0,
+                                                  'replays_passed': 0, 'fastest_frame': None, 'time_ms': 0.0})
+        summary['spawn_in_death'] |= result['spawn_in_death']
+        summary['time_ms'] += result['load_ms'] + result['run_ms']
+        if result['job'] == 'simulate':
+            summary['simulated_agents'] += result['agents']
+            summary['reached'] += result['reached']
+        else:
+            summary['replays'] += 1
+            summary['replays_passed'] += result['reached'] > 0
+            if not result['reached']:
+                summary['problems'].append('replay {} no longer reaches the exit'.format(result['replay']))
+        if result['first_frame'] is not None and (summary['fastest_frame'] is None or
+                                                  result['first_frame'] < summary['fastest_frame']):
+            summary['fastest_frame'] = result['first_frame']
+
+    for name, summary in maps.items():
+        policy = dict(POLICY, **policies.get(name, {}))
+        if summary['spawn_in_death']:
+            summary['problems'].append('spawn is inside a death block')
+        if not summary['exits'] and policy['exit']:
+            summary['problems'].append('no exit')
+        if summary['problems']:
+            summary['status'] = 'fail'
+        elif not summary['exits']:
+            summary['status'] = 'skipped'
+        elif summary['reached'] or summary['replays_passed'] or summary['navigable']:
+            summary['status'] = 'pass'
+        elif summary['navigable'] is False:
+            summary['status'] = 'fail'
+            summary['problems'].append('nothing reached the exit and the navigation graph says nothing can')
+        else:
+            summary['status'] = 'fail' if strict or policy['required'] else 'unverified'
+            summary['problems'].append('nothing reached the exit')
+            summary['problems'].append('no up to date navigation graph')
+    return maps
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description='Check that every map can still be finished.')
+    parser.add_argument('maps', nargs='*', help='tmx files or names of maps in maps/, every map by default')
+    parser.add_argument('--seeds', type=int, default=SIMULATION_SEEDS, help='simulated batches per map')
+    parser.add_argument('--agents', type=int, default=SIMULATION_AGENTS, help='simulated players per batch')
+    parser.add_argument('--frames', type=int, default=SIMULATION_FRAMES, help='frames each batch runs for')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--output', help='write every result to this json file')
+    parser.add_argument('--replays', default=path.join(GAME_FOLDER, 'replays'),
+                        help='replay file or folder of .rep files to play through')
+    parser.add_argument('--policy', default=path.join(GAME_FOLDER, 'maps', 'validation.json'),
+                        help='json file of what each map has to live up to')
+    parser.add_argument('--strict', action='store_true', help='fail every map nothing got to the exit of')
+    options = parser.parse_args(args)
+
+    if options.maps:
+        map_files = [path.abspath(name) if path.isfile(name) else path.join(GAME_FOLDER, 'maps', name)
+                     for name in options.maps]
+    else:
+        map_files = sorted(glob.glob(path.join(GAME_FOLDER, 'maps', '*.tmx')))
+    replay_files = []
+    if path.isdir(options.replays):
+        replay_files = sorted(glob.glob(path.join(options.replays, '*.rep')))
+    elif path.isfile(options.replays):
+        replay_files = [options.replays]
+    policies = {}
+    if path.isfile(options.policy):
+        with open(options.policy) as f:
+            policies = json.load(f)
+
+    # a job per map and seed plus one per replay, so every worker gets something to do however few maps there
+    # are. Simulations go first so the pool starts on the long ones.
+    jobs = [('simulate', (map_file, seed, options.agents, options.frames))
+            for map_file in map_files for seed in range(options.seeds)]
+    jobs += [('replay', (replay_file,)) for replay_file in replay_files]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=options.workers, initializer=start_worker) as pool:
+        results = [result for job_results in pool.map(run_job, jobs) for result in job_results]
+    wall_time = time.perf_counter() - start
+
+    # replays of maps that weren't asked for don't count
+    names = {path.basename(map_file) for map_file in map_files}
+    results = [result for result in results if result['map'] in names]
+    maps = summarize(results, policies, options.strict)
+    for name, summary in sorted(maps.items()):
+        print('{:<16}{:>11}  agents at exit {:>5} / {:<5} replays {} / {}  graph {:<3}  fastest {:>6}  {:8.0f} ms  {}'
+              .format(name, summary['status'], summary['reached'], summary['simulated_agents'],
+                      summary['replays_passed'], summary['replays'],
+                      {True: 'yes', False: 'no', None: '-'}[summary['navigable']],
+                      '-' if summary['fastest_frame'] is None else summary['fastest_frame'],
+                      summary['time_ms'], '; '.join(summary['problems'])))
+    print('{} jobs on {} workers in {:.1f} s'.format(len(jobs), options.workers, wall_time))
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump({'workers': options.workers, 'wall_time_s': wall_time, 'maps': maps, 'jobs': results}, f,
+                      indent=1)
+        print('results written to ' + options.output)
+    failed = any(summary['status'] == 'fail' for summary in maps.values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])